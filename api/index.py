@@ -1,10 +1,13 @@
 # Vercel Serverless Function for IT Inventory Tracker API
 from http.server import BaseHTTPRequestHandler
+import gzip
 import json
 import os
 import re
+import brotli
 from urllib.parse import parse_qs, urlparse
-from datetime import datetime
+import math
+from datetime import date, datetime, timedelta
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
@@ -22,25 +25,165 @@ def get_db_connection():
 
 def json_serial(obj):
     """JSON serializer for objects not serializable by default json code"""
-    if isinstance(obj, datetime):
+    if isinstance(obj, (datetime, date)):
         return obj.isoformat()
     raise TypeError(f"Type {type(obj)} not serializable")
 
+# Tenant (school) for requests without an X-Tenant-Id header, and for existing rows
+DEFAULT_TENANT = 'default'
+TENANT_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,50}$")
+
+# SQL text for the items list, keyed by which filters are active
+ITEM_FILTER_SQL = {
+    'search': "(name ILIKE %s OR location ILIKE %s OR notes ILIKE %s)",
+    'type': "type = %s",
+    'status': "status = %s",
+    'location': "location_id IN (SELECT id FROM locations WHERE tenant_id = %s AND name ILIKE %s)",
+}
+_items_sql_cache = {}
+
+# Columns the items list may be narrowed to with ?fields= (ItemResponse fields)
+ITEM_FIELDS = ('name', 'type', 'location', 'status', 'quantity', 'low_stock_threshold', 'notes',
+               'id', 'reserved', 'created_at', 'updated_at')
+
+def get_items_sql(active, fields=ITEM_FIELDS):
+    """Return the items list query for a tuple of active filter names and projected fields"""
+    key = (fields, active)
+    query = _items_sql_cache.get(key)
+    if query is None:
+        # Every read is scoped to one tenant's live (not soft-deleted) rows
+        where = " AND ".join(["tenant_id = %s", "deleted_at IS NULL", *(ITEM_FILTER_SQL[name] for name in active)])
+        query = f"SELECT {', '.join(fields)} FROM items WHERE {where} ORDER BY updated_at DESC"
+        _items_sql_cache[key] = query
+    return query
+
+# Responses at least this large are brotli/gzip-encoded for clients that accept it
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+
+def choose_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header, honouring q-values"""
+    weights = {}
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        params = params.strip()
+        try:
+            weights[coding.strip()] = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            weights[coding.strip()] = 0.0
+    best = None
+    for coding in ('br', 'gzip'):
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+# "Room 205", "Annex, Room 12" or "Main Building - Room 3B"
+ROOM_PATTERN = re.compile(r"^(?:(?P<building>.+?)\s*[,/-]\s*)?Room\s+(?P<room>[\w-]+)$", re.IGNORECASE)
+
+def normalize_location(name):
+    """Trim and collapse whitespace; a blank name means no location"""
+    if name is None:
+        return None
+    return " ".join(name.split()) or None
+
+def upsert_location(cur, tenant_id, name):
+    """Return (id, name) of the tenant's locations row for name, creating it if needed"""
+    name = normalize_location(name)
+    if name is None:
+        return None, None
+    match = ROOM_PATTERN.match(name)
+    building, room = (match.group('building'), match.group('room')) if match else (None, None)
+    cur.execute("""
+        INSERT INTO locations (tenant_id, name, key, building, room, item_count)
+        VALUES (%s, %s, %s, %s, %s, 0)
+        ON CONFLICT (tenant_id, key) DO UPDATE SET key = EXCLUDED.key
+        RETURNING id, name
+    """, (tenant_id, name, name.lower(), building, room))
+    row = cur.fetchone()
+    return row['id'], row['name']
+
+def adjust_location_count(cur, location_id, delta):
+    if location_id is not None:
+        cur.execute("UPDATE locations SET item_count = item_count + %s WHERE id = %s", (delta, location_id))
+
+def bump_item_version(cur, tenant_id):
+    """Count a change to the tenant's items, so the FastAPI backend's in-memory indexes notice it"""
+    cur.execute("""
+        INSERT INTO item_versions (tenant_id, version) VALUES (%s, 1)
+        ON CONFLICT (tenant_id) DO UPDATE SET version = item_versions.version + 1
+    """, (tenant_id,))
+
+# Days of consumption history a stock forecast averages over by default
+STOCK_FORECAST_DAYS = int(os.environ.get('STOCK_FORECAST_DAYS', '30'))
+
+def record_movement(cur, tenant_id, item_id, kind, quantity, balance, notes=None, reservation_id=None):
+    """Append to a part's stock ledger and fold receipts/consumption into today's daily totals"""
+    cur.execute("""
+        INSERT INTO stock_movements (tenant_id, item_id, kind, quantity, balance, reservation_id, notes, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+        RETURNING id, item_id, kind, quantity, balance, reservation_id, notes, created_at
+    """, (tenant_id, item_id, kind, quantity, balance, reservation_id, notes))
+    movement = dict(cur.fetchone())
+    if kind in ('receive', 'consume'):
+        received, consumed = (quantity, 0) if kind == 'receive' else (0, -quantity)
+        cur.execute("""
+            INSERT INTO stock_daily_totals (tenant_id, item_id, day, received, consumed)
+            VALUES (%s, %s, (NOW() AT TIME ZONE 'UTC')::date, %s, %s)
+            ON CONFLICT (item_id, day) DO UPDATE SET
+                received = stock_daily_totals.received + EXCLUDED.received,
+                consumed = stock_daily_totals.consumed + EXCLUDED.consumed
+        """, (tenant_id, item_id, received, consumed))
+    return movement
+
+# Conditional balance updates, so concurrent requests cannot take the same units
+STOCK_GUARDS = {
+    'receive': "TRUE",
+    'consume': "quantity - reserved >= %s",
+    'adjust': "quantity + %s >= 0",
+}
+
 class handler(BaseHTTPRequestHandler):
-    def send_json_response(self, status_code, data):
+    def send_json_response(self, status_code, data, headers=None):
+        body = json.dumps(data, default=json_serial).encode()
+        encoding = None
+        if len(body) >= COMPRESS_MIN_BYTES:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding', ''))
+        if encoding == 'br':
+            body = brotli.compress(body, quality=4)
+        elif encoding == 'gzip':
+            body = gzip.compress(body, compresslevel=6)
+        
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+            self.send_header('Vary', 'Accept-Encoding')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Tenant-Id')
+        self.send_header('Access-Control-Expose-Headers', 'X-Total-Count, X-Total-Count-Estimated')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data, default=json_serial).encode())
+        self.wfile.write(body)
     
     def send_error_response(self, status_code, message):
         self.send_json_response(status_code, {"detail": message})
     
+    def resolve_tenant(self):
+        """Set self.tenant_id from the X-Tenant-Id header; sends a 400 and returns False if invalid"""
+        tenant_id = (self.headers.get('X-Tenant-Id') or '').strip() or DEFAULT_TENANT
+        if not TENANT_PATTERN.match(tenant_id):
+            self.send_error_response(400, "Invalid X-Tenant-Id header")
+            return False
+        self.tenant_id = tenant_id
+        return True
+    
     def do_GET(self):
         try:
+            if not self.resolve_tenant():
+                return
             parsed = urlparse(self.path)
             path = parsed.path.rstrip('/')
             query_params = parse_qs(parsed.query)
@@ -55,6 +198,26 @@ class handler(BaseHTTPRequestHandler):
             elif re.match(r'^/api/items/\d+$', path):
                 item_id = int(path.split('/')[-1])
                 self.handle_get_item(item_id)
+            # GET /api/items/{id}/movements
+            elif re.match(r'^/api/items/\d+/movements$', path):
+                item_id = int(path.split('/')[-2])
+                self.handle_get_movements(item_id, query_params)
+            # GET /api/items/{id}/consumption
+            elif re.match(r'^/api/items/\d+/consumption$', path):
+                item_id = int(path.split('/')[-2])
+                self.handle_get_consumption(item_id, query_params)
+            # GET /api/stock/forecast
+            elif path == '/api/stock/forecast':
+                self.handle_stock_forecast(query_params)
+            # GET /api/reservations
+            elif path == '/api/reservations':
+                self.handle_get_reservations(query_params)
+            # GET /api/checkouts
+            elif path == '/api/checkouts':
+                self.handle_get_checkouts(query_params)
+            # GET /api/suggest
+            elif path == '/api/suggest':
+                self.handle_suggest(query_params)
             # GET /api/locations
             elif path == '/api/locations':
                 self.handle_get_locations()
@@ -68,6 +231,8 @@ class handler(BaseHTTPRequestHandler):
     
     def do_POST(self):
         try:
+            if not self.resolve_tenant():
+                return
             parsed = urlparse(self.path)
             path = parsed.path.rstrip('/')
             
@@ -77,6 +242,39 @@ class handler(BaseHTTPRequestHandler):
                 body = self.rfile.read(content_length)
                 data = json.loads(body) if body else {}
                 self.handle_create_item(data)
+            # POST /api/items/{id}/checkout
+            elif re.match(r'^/api/items/\d+/checkout$', path):
+                item_id = int(path.split('/')[-2])
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(content_length)
+                data = json.loads(body) if body else {}
+                self.handle_checkout_item(item_id, data)
+            # POST /api/items/{id}/checkin
+            elif re.match(r'^/api/items/\d+/checkin$', path):
+                item_id = int(path.split('/')[-2])
+                self.handle_checkin_item(item_id)
+            # POST /api/items/{id}/restore
+            elif re.match(r'^/api/items/\d+/restore$', path):
+                item_id = int(path.split('/')[-2])
+                self.handle_restore_item(item_id)
+            # POST /api/items/{id}/movements
+            elif re.match(r'^/api/items/\d+/movements$', path):
+                item_id = int(path.split('/')[-2])
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(content_length)
+                data = json.loads(body) if body else {}
+                self.handle_create_movement(item_id, data)
+            # POST /api/items/{id}/reservations
+            elif re.match(r'^/api/items/\d+/reservations$', path):
+                item_id = int(path.split('/')[-2])
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(content_length)
+                data = json.loads(body) if body else {}
+                self.handle_create_reservation(item_id, data)
+            # POST /api/reservations/{id}/fulfill or /release
+            elif re.match(r'^/api/reservations/\d+/(fulfill|release)$', path):
+                reservation_id = int(path.split('/')[-2])
+                self.handle_close_reservation(reservation_id, path.split('/')[-1])
             else:
                 self.send_error_response(404, f"Not found: {path}")
         except json.JSONDecodeError:
@@ -86,6 +284,8 @@ class handler(BaseHTTPRequestHandler):
     
     def do_PUT(self):
         try:
+            if not self.resolve_tenant():
+                return
             parsed = urlparse(self.path)
             path = parsed.path.rstrip('/')
             
@@ -105,6 +305,8 @@ class handler(BaseHTTPRequestHandler):
     
     def do_DELETE(self):
         try:
+            if not self.resolve_tenant():
+                return
             parsed = urlparse(self.path)
             path = parsed.path.rstrip('/')
             
@@ -121,7 +323,7 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Tenant-Id')
         self.end_headers()
     
     # === Handler Methods ===
@@ -130,34 +332,35 @@ class handler(BaseHTTPRequestHandler):
         conn = get_db_connection()
         try:
             cur = conn.cursor()
+            tenant = (self.tenant_id,)
             
             # Get counts
-            cur.execute("SELECT COUNT(*) as count FROM items")
+            cur.execute("SELECT COUNT(*) as count FROM items WHERE tenant_id = %s AND deleted_at IS NULL", tenant)
             total_items = cur.fetchone()['count']
             
-            cur.execute("SELECT COUNT(*) as count FROM items WHERE type = 'device'")
+            cur.execute("SELECT COUNT(*) as count FROM items WHERE tenant_id = %s AND deleted_at IS NULL AND type = 'device'", tenant)
             total_devices = cur.fetchone()['count']
             
-            cur.execute("SELECT COUNT(*) as count FROM items WHERE type = 'part'")
+            cur.execute("SELECT COUNT(*) as count FROM items WHERE tenant_id = %s AND deleted_at IS NULL AND type = 'part'", tenant)
             total_parts = cur.fetchone()['count']
             
-            cur.execute("SELECT COUNT(*) as count FROM items WHERE status = 'available'")
+            cur.execute("SELECT COUNT(*) as count FROM items WHERE tenant_id = %s AND deleted_at IS NULL AND status = 'available'", tenant)
             available_count = cur.fetchone()['count']
             
-            cur.execute("SELECT COUNT(*) as count FROM items WHERE status = 'in_use'")
+            cur.execute("SELECT COUNT(*) as count FROM items WHERE tenant_id = %s AND deleted_at IS NULL AND status = 'in_use'", tenant)
             in_use_count = cur.fetchone()['count']
             
-            cur.execute("SELECT COUNT(*) as count FROM items WHERE status = 'broken'")
+            cur.execute("SELECT COUNT(*) as count FROM items WHERE tenant_id = %s AND deleted_at IS NULL AND status = 'broken'", tenant)
             broken_count = cur.fetchone()['count']
             
-            cur.execute("SELECT COUNT(*) as count FROM items WHERE status = 'checked_out'")
+            cur.execute("SELECT COUNT(*) as count FROM items WHERE tenant_id = %s AND deleted_at IS NULL AND status = 'checked_out'", tenant)
             checked_out_count = cur.fetchone()['count']
             
             # Get low stock items
             cur.execute("""
                 SELECT * FROM items 
-                WHERE type = 'part' AND quantity <= low_stock_threshold
-            """)
+                WHERE tenant_id = %s AND deleted_at IS NULL AND type = 'part' AND quantity <= low_stock_threshold
+            """, tenant)
             low_stock_items = [dict(row) for row in cur.fetchall()]
             
             response = {
@@ -179,37 +382,51 @@ class handler(BaseHTTPRequestHandler):
         try:
             cur = conn.cursor()
             
-            # Build query with filters
-            query = "SELECT * FROM items WHERE 1=1"
-            params = []
+            # Collect filter values; the SQL text for each filter combination is cached
+            params = [self.tenant_id]
+            active = []
             
             search = query_params.get('search', [None])[0]
             if search:
-                query += " AND (name ILIKE %s OR location ILIKE %s OR notes ILIKE %s)"
                 search_pattern = f"%{search}%"
                 params.extend([search_pattern, search_pattern, search_pattern])
+                active.append('search')
             
             item_type = query_params.get('type', [None])[0]
             if item_type:
-                query += " AND type = %s"
                 params.append(item_type)
+                active.append('type')
             
             status = query_params.get('status', [None])[0]
             if status:
-                query += " AND status = %s"
                 params.append(status)
+                active.append('status')
             
             location = query_params.get('location', [None])[0]
             if location:
-                query += " AND location ILIKE %s"
-                params.append(f"%{location}%")
+                params.extend([self.tenant_id, f"%{location}%"])
+                active.append('location')
             
-            query += " ORDER BY updated_at DESC"
+            # ?fields=name,status narrows the SELECT itself; id is always returned
+            fields = ITEM_FIELDS
+            requested = [f.strip() for f in query_params.get('fields', [''])[0].split(',') if f.strip()]
+            if requested:
+                if not set(requested) <= set(ITEM_FIELDS):
+                    self.send_error_response(400, f"fields must be from: {', '.join(ITEM_FIELDS)}")
+                    return
+                fields = tuple(f for f in ITEM_FIELDS if f == 'id' or f in requested)
+            
+            query = get_items_sql(tuple(active), fields)
             
             cur.execute(query, params)
             items = [dict(row) for row in cur.fetchall()]
             
-            self.send_json_response(200, items)
+            # This handler returns every match, so the total is exact
+            headers = None
+            if query_params.get('with_total', ['false'])[0] == 'true':
+                headers = {'X-Total-Count': str(len(items)), 'X-Total-Count-Estimated': 'false'}
+            
+            self.send_json_response(200, items, headers)
         finally:
             conn.close()
     
@@ -217,7 +434,10 @@ class handler(BaseHTTPRequestHandler):
         conn = get_db_connection()
         try:
             cur = conn.cursor()
-            cur.execute("SELECT * FROM items WHERE id = %s", (item_id,))
+            cur.execute(
+                "SELECT * FROM items WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL",
+                (item_id, self.tenant_id),
+            )
             item = cur.fetchone()
             
             if item:
@@ -231,25 +451,186 @@ class handler(BaseHTTPRequestHandler):
         conn = get_db_connection()
         try:
             cur = conn.cursor()
-            cur.execute("SELECT DISTINCT location FROM items WHERE location IS NOT NULL AND location != '' ORDER BY location")
-            locations = [row['location'] for row in cur.fetchall()]
+            cur.execute(
+                "SELECT name FROM locations WHERE tenant_id = %s AND item_count > 0 ORDER BY name",
+                (self.tenant_id,),
+            )
+            locations = [row['name'] for row in cur.fetchall()]
             self.send_json_response(200, locations)
         finally:
             conn.close()
     
+    CHECKOUT_COLUMNS = """
+        c.id, c.item_id, i.name AS item_name, c.assignee, c.out_at, c.due_at, c.returned_at, c.notes
+    """
+    
+    def handle_get_checkouts(self, query_params):
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            
+            query = (
+                f"SELECT {self.CHECKOUT_COLUMNS} FROM checkouts c JOIN items i ON i.id = c.item_id"
+                " WHERE c.tenant_id = %s AND i.deleted_at IS NULL"
+            )
+            params = [self.tenant_id]
+            
+            assignee = query_params.get('assignee', [None])[0]
+            if assignee:
+                query += " AND c.assignee = %s"
+                params.append(assignee)
+            
+            overdue = query_params.get('overdue', ['false'])[0] == 'true'
+            if overdue or query_params.get('open', ['false'])[0] == 'true':
+                query += " AND c.returned_at IS NULL"
+            if overdue:
+                # Served by the partial index on the tenant's open checkouts' due_at
+                query += " AND c.due_at < NOW() ORDER BY c.due_at"
+            else:
+                query += " ORDER BY c.out_at DESC"
+            
+            cur.execute(query, params)
+            self.send_json_response(200, [dict(row) for row in cur.fetchall()])
+        finally:
+            conn.close()
+    
+    def handle_checkout_item(self, item_id, data):
+        if not data.get('assignee'):
+            self.send_error_response(422, "assignee is required")
+            return
+        
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            
+            cur.execute(
+                "SELECT id FROM items WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL",
+                (item_id, self.tenant_id),
+            )
+            if not cur.fetchone():
+                self.send_error_response(404, "Item not found")
+                return
+            
+            # Flip the status and open the checkout in one transaction
+            cur.execute("""
+                UPDATE items SET status = 'checked_out', updated_at = NOW()
+                WHERE id = %s AND status != 'checked_out'
+            """, (item_id,))
+            if cur.rowcount != 1:
+                conn.rollback()
+                self.send_error_response(409, "Item is already checked out")
+                return
+            
+            cur.execute(f"""
+                WITH c AS (
+                    INSERT INTO checkouts (tenant_id, item_id, assignee, due_at, notes, out_at)
+                    VALUES (%s, %s, %s, %s, %s, NOW())
+                    RETURNING *
+                )
+                SELECT {self.CHECKOUT_COLUMNS} FROM c JOIN items i ON i.id = c.item_id
+            """, (self.tenant_id, item_id, data['assignee'], data.get('due_at'), data.get('notes')))
+            checkout = cur.fetchone()
+            bump_item_version(cur, self.tenant_id)
+            conn.commit()
+            
+            self.send_json_response(201, dict(checkout))
+        finally:
+            conn.close()
+    
+    def handle_checkin_item(self, item_id):
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            
+            cur.execute(
+                "SELECT id FROM items WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL",
+                (item_id, self.tenant_id),
+            )
+            if not cur.fetchone():
+                self.send_error_response(404, "Item not found")
+                return
+            
+            cur.execute(f"""
+                WITH c AS (
+                    UPDATE checkouts SET returned_at = NOW()
+                    WHERE item_id = %s AND returned_at IS NULL
+                    RETURNING *
+                )
+                SELECT {self.CHECKOUT_COLUMNS} FROM c JOIN items i ON i.id = c.item_id
+            """, (item_id,))
+            checkout = cur.fetchone()
+            if not checkout:
+                conn.rollback()
+                self.send_error_response(409, "Item is not checked out")
+                return
+            
+            cur.execute("""
+                UPDATE items SET status = 'available', updated_at = NOW()
+                WHERE id = %s
+            """, (item_id,))
+            bump_item_version(cur, self.tenant_id)
+            conn.commit()
+            
+            self.send_json_response(200, dict(checkout))
+        finally:
+            conn.close()
+    
+    def handle_suggest(self, query_params):
+        q = (query_params.get('q', [''])[0] or '').strip()
+        field = query_params.get('field', ['name'])[0]
+        if not q or field not in ('name', 'location'):
+            self.send_error_response(422, "q is required and field must be 'name' or 'location'")
+            return
+        try:
+            limit = max(1, min(int(query_params.get('limit', ['8'])[0]), 25))
+        except ValueError:
+            self.send_error_response(422, "limit must be an integer")
+            return
+        
+        # Match the start of the value or of any word in it; on items both patterns are served by
+        # the pg_trgm index on live names, where a plain b-tree cannot serve '% q%'
+        escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        patterns = (f"{escaped}%", f"% {escaped}%")
+        
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            if field == 'name':
+                cur.execute("""
+                    SELECT DISTINCT name AS value FROM items
+                    WHERE tenant_id = %s AND deleted_at IS NULL AND (name ILIKE %s OR name ILIKE %s)
+                    ORDER BY name LIMIT %s
+                """, (self.tenant_id, *patterns, limit))
+            else:
+                cur.execute("""
+                    SELECT name AS value FROM locations
+                    WHERE tenant_id = %s AND item_count > 0 AND (name ILIKE %s OR name ILIKE %s)
+                    ORDER BY name LIMIT %s
+                """, (self.tenant_id, *patterns, limit))
+            self.send_json_response(200, [row['value'] for row in cur.fetchall()])
+        finally:
+            conn.close()
+    
     def handle_create_item(self, data):
+        if isinstance(data.get('quantity'), int) and data['quantity'] < 0:
+            self.send_error_response(400, "quantity cannot be negative")
+            return
         conn = get_db_connection()
         try:
             cur = conn.cursor()
             
+            location_id, location = upsert_location(cur, self.tenant_id, data.get('location'))
+            
             cur.execute("""
-                INSERT INTO items (name, type, location, status, quantity, low_stock_threshold, notes, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+                INSERT INTO items (tenant_id, name, type, location, location_id, status, quantity, low_stock_threshold, notes, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
                 RETURNING *
             """, (
+                self.tenant_id,
                 data.get('name'),
                 data.get('type', 'device'),
-                data.get('location', ''),
+                location,
+                location_id,
                 data.get('status', 'available'),
                 data.get('quantity', 1),
                 data.get('low_stock_threshold', 5),
@@ -257,6 +638,10 @@ class handler(BaseHTTPRequestHandler):
             ))
             
             item = cur.fetchone()
+            adjust_location_count(cur, location_id, 1)
+            if item['type'] == 'part' and item['quantity']:
+                record_movement(cur, self.tenant_id, item['id'], 'receive', item['quantity'], item['quantity'], "Opening balance")
+            bump_item_version(cur, self.tenant_id)
             conn.commit()
             
             self.send_json_response(201, dict(item))
@@ -264,23 +649,43 @@ class handler(BaseHTTPRequestHandler):
             conn.close()
     
     def handle_update_item(self, item_id, data):
+        if isinstance(data.get('quantity'), int) and data['quantity'] < 0:
+            self.send_error_response(400, "quantity cannot be negative")
+            return
         conn = get_db_connection()
         try:
             cur = conn.cursor()
             
-            # Check if item exists
-            cur.execute("SELECT * FROM items WHERE id = %s", (item_id,))
+            # Check if item exists; the row lock keeps an edited part count in step with its ledger
+            cur.execute(
+                "SELECT * FROM items WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL FOR UPDATE",
+                (item_id, self.tenant_id),
+            )
             existing = cur.fetchone()
             if not existing:
                 self.send_error_response(404, "Item not found")
                 return
             
+            # checked_out is only entered and left through checkout/checkin, which keep the checkouts table in step
+            if data.get('status') and (data['status'] == 'checked_out') != (existing['status'] == 'checked_out'):
+                self.send_error_response(409, "Use checkout and checkin to change a checked-out status")
+                return
+            
+            # Move the item between locations if its location changed
+            location_id, location = existing['location_id'], None
+            if normalize_location(data.get('location')) is not None:
+                location_id, location = upsert_location(cur, self.tenant_id, data['location'])
+                if location_id != existing['location_id']:
+                    adjust_location_count(cur, existing['location_id'], -1)
+                    adjust_location_count(cur, location_id, 1)
+            
             # Update item
             cur.execute("""
                 UPDATE items SET
                     name = COALESCE(%s, name),
                     type = COALESCE(%s, type),
                     location = COALESCE(%s, location),
+                    location_id = %s,
                     status = COALESCE(%s, status),
                     quantity = COALESCE(%s, quantity),
                     low_stock_threshold = COALESCE(%s, low_stock_threshold),
@@ -291,7 +696,8 @@ class handler(BaseHTTPRequestHandler):
             """, (
                 data.get('name'),
                 data.get('type'),
-                data.get('location'),
+                location,
+                location_id,
                 data.get('status'),
                 data.get('quantity'),
                 data.get('low_stock_threshold'),
@@ -300,6 +706,28 @@ class handler(BaseHTTPRequestHandler):
             ))
             
             item = cur.fetchone()
+            # A part's quantity is its ledger balance: an edited count is recorded as an adjustment,
+            # and a change of type opens or closes the ledger
+            was_part, is_part = existing['type'] == 'part', item['type'] == 'part'
+            if is_part and not was_part:
+                if item['quantity']:
+                    record_movement(cur, self.tenant_id, item_id, 'receive', item['quantity'], item['quantity'], "Opening balance")
+            elif was_part and not is_part:
+                if existing['quantity']:
+                    record_movement(cur, self.tenant_id, item_id, 'adjust', -existing['quantity'], 0, "Closing balance")
+                # A device holds no stock, so nothing is left for its reservations to use
+                cur.execute(
+                    "UPDATE stock_reservations SET status = 'released', closed_at = NOW() WHERE item_id = %s AND status = 'open'",
+                    (item_id,),
+                )
+                cur.execute("UPDATE items SET reserved = 0 WHERE id = %s RETURNING *", (item_id,))
+                item = cur.fetchone()
+            elif is_part and item['quantity'] != existing['quantity']:
+                record_movement(
+                    cur, self.tenant_id, item_id, 'adjust',
+                    (item['quantity'] or 0) - (existing['quantity'] or 0), item['quantity'], "Edited",
+                )
+            bump_item_version(cur, self.tenant_id)
             conn.commit()
             
             self.send_json_response(200, dict(item))
@@ -311,16 +739,310 @@ class handler(BaseHTTPRequestHandler):
         try:
             cur = conn.cursor()
             
-            # Check if item exists
-            cur.execute("SELECT * FROM items WHERE id = %s", (item_id,))
+            # Soft delete: the row and its checkouts stay until the purge job removes them
+            cur.execute("""
+                UPDATE items SET deleted_at = NOW()
+                WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL
+                RETURNING location_id
+            """, (item_id, self.tenant_id))
             existing = cur.fetchone()
             if not existing:
+                conn.rollback()
                 self.send_error_response(404, "Item not found")
                 return
             
-            cur.execute("DELETE FROM items WHERE id = %s", (item_id,))
+            adjust_location_count(cur, existing['location_id'], -1)
+            bump_item_version(cur, self.tenant_id)
             conn.commit()
             
             self.send_json_response(200, {"message": "Item deleted successfully"})
         finally:
             conn.close()
+    
+    def handle_restore_item(self, item_id):
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            
+            cur.execute("""
+                UPDATE items SET deleted_at = NULL, updated_at = NOW()
+                WHERE id = %s AND tenant_id = %s AND deleted_at IS NOT NULL
+                RETURNING *
+            """, (item_id, self.tenant_id))
+            item = cur.fetchone()
+            if not item:
+                conn.rollback()
+                self.send_error_response(404, "Deleted item not found")
+                return
+            
+            adjust_location_count(cur, item['location_id'], 1)
+            bump_item_version(cur, self.tenant_id)
+            conn.commit()
+            
+            self.send_json_response(200, dict(item))
+        finally:
+            conn.close()
+    
+    # === Stock ledger and reservations (spare parts only) ===
+    
+    def get_part(self, cur, item_id):
+        """The tenant's live part, or None after sending a 404/400"""
+        cur.execute(
+            "SELECT * FROM items WHERE id = %s AND tenant_id = %s AND deleted_at IS NULL",
+            (item_id, self.tenant_id),
+        )
+        item = cur.fetchone()
+        if not item:
+            self.send_error_response(404, "Item not found")
+            return None
+        if item['type'] != 'part':
+            self.send_error_response(400, "Stock is only tracked for spare parts")
+            return None
+        return item
+    
+    def handle_create_movement(self, item_id, data):
+        kind, quantity = data.get('kind'), data.get('quantity')
+        if kind not in STOCK_GUARDS or not isinstance(quantity, int) or quantity == 0 or (kind != 'adjust' and quantity < 0):
+            self.send_error_response(400, "kind must be receive, consume or adjust with a positive quantity (non-zero for adjust)")
+            return
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            if not self.get_part(cur, item_id):
+                return
+            
+            delta = -quantity if kind == 'consume' else quantity
+            cur.execute(f"""
+                UPDATE items SET quantity = quantity + %s, updated_at = NOW()
+                WHERE id = %s AND deleted_at IS NULL AND {STOCK_GUARDS[kind]}
+                RETURNING quantity
+            """, (delta, item_id, *([] if kind == 'receive' else [quantity])))
+            row = cur.fetchone()
+            if not row:
+                conn.rollback()
+                self.send_error_response(409, "Not enough unreserved stock")
+                return
+            
+            movement = record_movement(cur, self.tenant_id, item_id, kind, delta, row['quantity'], data.get('notes'))
+            bump_item_version(cur, self.tenant_id)
+            conn.commit()
+            self.send_json_response(201, movement)
+        finally:
+            conn.close()
+    
+    def handle_get_movements(self, item_id, query_params):
+        limit = min(int(query_params.get('limit', ['100'])[0]), 1000)
+        skip = int(query_params.get('skip', ['0'])[0])
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            if not self.get_part(cur, item_id):
+                return
+            cur.execute("""
+                SELECT id, item_id, kind, quantity, balance, reservation_id, notes, created_at
+                FROM stock_movements WHERE item_id = %s
+                ORDER BY created_at DESC, id DESC OFFSET %s LIMIT %s
+            """, (item_id, skip, limit))
+            self.send_json_response(200, [dict(row) for row in cur.fetchall()])
+        finally:
+            conn.close()
+    
+    def handle_get_consumption(self, item_id, query_params):
+        days = max(1, min(int(query_params.get('days', [str(STOCK_FORECAST_DAYS)])[0]), 366))
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            if not self.get_part(cur, item_id):
+                return
+            cur.execute("""
+                SELECT day, received, consumed FROM stock_daily_totals
+                WHERE item_id = %s AND day > (NOW() AT TIME ZONE 'UTC')::date - %s
+                ORDER BY day
+            """, (item_id, days))
+            self.send_json_response(200, [dict(row) for row in cur.fetchall()])
+        finally:
+            conn.close()
+    
+    def handle_stock_forecast(self, query_params):
+        days = max(1, min(int(query_params.get('days', [str(STOCK_FORECAST_DAYS)])[0]), 366))
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            # Served from the daily totals rather than the ledger
+            cur.execute("""
+                SELECT i.id AS item_id, i.name, COALESCE(i.quantity, 0) AS quantity, i.reserved,
+                       COALESCE(i.low_stock_threshold, 0) AS low_stock_threshold,
+                       COALESCE(t.consumed, 0) AS consumed, (NOW() AT TIME ZONE 'UTC')::date AS today
+                FROM items i
+                LEFT JOIN (
+                    SELECT item_id, SUM(consumed) AS consumed FROM stock_daily_totals
+                    WHERE tenant_id = %s AND day > (NOW() AT TIME ZONE 'UTC')::date - %s
+                    GROUP BY item_id
+                ) t ON t.item_id = i.id
+                WHERE i.tenant_id = %s AND i.deleted_at IS NULL AND i.type = 'part'
+            """, (self.tenant_id, days, self.tenant_id))
+            
+            forecasts = []
+            for row in cur.fetchall():
+                row = dict(row)
+                today = row.pop('today')
+                row['consumed'] = int(row['consumed'])
+                row['per_day'] = row['consumed'] / days
+                # Reserved units are as good as gone
+                headroom = row['quantity'] - row['reserved'] - row['low_stock_threshold']
+                if headroom <= 0:
+                    days_left = 0.0
+                elif row['per_day'] > 0:
+                    days_left = headroom / row['per_day']
+                else:
+                    days_left = None
+                row['days_until_low_stock'] = days_left
+                # A slow enough rate puts the date past the end of the calendar; leave it undated
+                if days_left is None or days_left >= (date.max - today).days:
+                    row['low_stock_on'] = None
+                else:
+                    row['low_stock_on'] = today + timedelta(days=math.floor(days_left))
+                forecasts.append(row)
+            
+            # Soonest first; parts with no recent consumption last
+            forecasts.sort(key=lambda f: (f['days_until_low_stock'] is None, f['days_until_low_stock'] or 0, f['name']))
+            self.send_json_response(200, forecasts)
+        finally:
+            conn.close()
+    
+    RESERVATION_COLUMNS = """
+        r.id, r.item_id, i.name AS item_name, r.quantity, r.holder, r.notes, r.status, r.created_at, r.closed_at
+    """
+    
+    def handle_create_reservation(self, item_id, data):
+        quantity, holder = data.get('quantity'), data.get('holder')
+        if not isinstance(quantity, int) or quantity <= 0 or not holder:
+            self.send_error_response(400, "quantity must be positive and holder is required")
+            return
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            if not self.get_part(cur, item_id):
+                return
+            
+            cur.execute("""
+                UPDATE items SET reserved = reserved + %s, updated_at = NOW()
+                WHERE id = %s AND deleted_at IS NULL AND quantity - reserved >= %s
+                RETURNING id
+            """, (quantity, item_id, quantity))
+            if not cur.fetchone():
+                conn.rollback()
+                self.send_error_response(409, "Not enough unreserved stock")
+                return
+            
+            cur.execute(f"""
+                WITH r AS (
+                    INSERT INTO stock_reservations (tenant_id, item_id, quantity, holder, notes, status, created_at)
+                    VALUES (%s, %s, %s, %s, %s, 'open', NOW())
+                    RETURNING *
+                )
+                SELECT {self.RESERVATION_COLUMNS} FROM r JOIN items i ON i.id = r.item_id
+            """, (self.tenant_id, item_id, quantity, holder, data.get('notes')))
+            reservation = dict(cur.fetchone())
+            bump_item_version(cur, self.tenant_id)
+            conn.commit()
+            self.send_json_response(201, reservation)
+        finally:
+            conn.close()
+    
+    def handle_get_reservations(self, query_params):
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            query = (
+                f"SELECT {self.RESERVATION_COLUMNS} FROM stock_reservations r JOIN items i ON i.id = r.item_id"
+                " WHERE r.tenant_id = %s AND i.deleted_at IS NULL"
+            )
+            params = [self.tenant_id]
+            
+            item_id = query_params.get('item_id', [None])[0]
+            if item_id:
+                query += " AND r.item_id = %s"
+                params.append(int(item_id))
+            if query_params.get('open', ['false'])[0] == 'true':
+                query += " AND r.status = 'open'"
+            
+            limit = min(int(query_params.get('limit', ['100'])[0]), 1000)
+            skip = int(query_params.get('skip', ['0'])[0])
+            query += " ORDER BY r.created_at DESC OFFSET %s LIMIT %s"
+            params.extend([skip, limit])
+            
+            cur.execute(query, params)
+            self.send_json_response(200, [dict(row) for row in cur.fetchall()])
+        finally:
+            conn.close()
+    
+    def handle_close_reservation(self, reservation_id, action):
+        """Fulfill (consume the held units) or release (give them back) an open reservation"""
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            
+            cur.execute(
+                "SELECT item_id FROM stock_reservations WHERE id = %s AND tenant_id = %s",
+                (reservation_id, self.tenant_id),
+            )
+            found = cur.fetchone()
+            if not found:
+                self.send_error_response(404, "Reservation not found")
+                return
+            
+            # Lock the item before the reservation, in the same order as a change of type takes them
+            cur.execute("SELECT type, deleted_at FROM items WHERE id = %s FOR UPDATE", (found['item_id'],))
+            part = cur.fetchone()
+            
+            # Only an open reservation can close, so a double submit cannot consume twice
+            status = 'fulfilled' if action == 'fulfill' else 'released'
+            cur.execute("""
+                UPDATE stock_reservations SET status = %s, closed_at = NOW()
+                WHERE id = %s AND status = 'open'
+                RETURNING item_id, quantity, holder
+            """, (status, reservation_id))
+            closed = cur.fetchone()
+            if not closed:
+                conn.rollback()
+                self.send_error_response(409, "Reservation is not open")
+                return
+            
+            q = closed['quantity']
+            if action == 'fulfill':
+                if part['deleted_at'] is not None:
+                    conn.rollback()
+                    self.send_error_response(409, "Part has been deleted; restore it or release the reservation")
+                    return
+                cur.execute("""
+                    UPDATE items SET quantity = quantity - %s, reserved = reserved - %s, updated_at = NOW()
+                    WHERE id = %s AND quantity >= %s
+                    RETURNING quantity
+                """, (q, q, closed['item_id'], q))
+                row = cur.fetchone()
+                if not row:
+                    conn.rollback()
+                    self.send_error_response(409, "Part has fewer units than the reservation")
+                    return
+                record_movement(
+                    cur, self.tenant_id, closed['item_id'], 'consume', -q, row['quantity'],
+                    f"Reservation for {closed['holder']}", reservation_id,
+                )
+            else:
+                # Deleted parts too, or a restored part would still hold the units
+                cur.execute(
+                    "UPDATE items SET reserved = reserved - %s, updated_at = NOW() WHERE id = %s",
+                    (q, closed['item_id']),
+                )
+            
+            cur.execute(
+                f"SELECT {self.RESERVATION_COLUMNS} FROM stock_reservations r JOIN items i ON i.id = r.item_id WHERE r.id = %s",
+                (reservation_id,),
+            )
+            reservation = dict(cur.fetchone())
+            bump_item_version(cur, self.tenant_id)
+            conn.commit()
+            self.send_json_response(200, reservation)
+        finally:
+            conn.close()
@@ -0,0 +1,209 @@
+"""
+Consistent snapshot export and fast restore of the inventory database.
+
+A dump is a gzip-compressed tar holding one CSV file per table plus a
+manifest. SQLite dumps read from a copy taken with the online backup API
+(which does not block writers in WAL mode); Postgres dumps COPY every table
+inside a single REPEATABLE READ, READ ONLY transaction. Restores drop the secondary indexes,
+bulk-load with COPY (Postgres) or executemany (SQLite) and build the indexes
+again once the rows are in.
+
+Run from the backend directory:
+    python -m app.backup dump inventory-backup.tar.gz
+    python -m app.backup restore inventory-backup.tar.gz [--replace]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+from sqlalchemy import Table, func, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .database import Base, engine
+from . import models, versions  # models also registers the tables on Base.metadata
+
+FORMAT_VERSION = 1
+# COPY's text marker for NULL, so empty strings and NULLs survive the round trip
+NULL = r"\N"
+LOAD_BATCH_ROWS = 10_000
+
+# Job results are transient and can be large, so they are not backed up. Change counters
+# belong to the live database: a restore bumps them instead of winding them back
+BACKUP_TABLES = [table for table in Base.metadata.sorted_tables if table.name not in ("jobs", "item_versions")]
+
+
+def _columns(table: Table) -> list[str]:
+    return [column.name for column in table.columns]
+
+
+def _dump_sqlite(bind: Engine, directory: str) -> dict[str, int]:
+    snapshot = sqlite3.connect(os.path.join(directory, "snapshot.db"))
+    source = bind.raw_connection()
+    try:
+        # One step: a stepwise copy restarts whenever another connection writes.
+        # Under WAL (SQLITE_TUNED) the copy reads a snapshot and writers carry on.
+        source.driver_connection.backup(snapshot)
+    finally:
+        source.close()
+
+    counts = {}
+    try:
+        for table in BACKUP_TABLES:
+            columns = _columns(table)
+            with open(os.path.join(directory, f"{table.name}.csv"), "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                rows = snapshot.execute(f"SELECT {', '.join(columns)} FROM {table.name}")
+                count = 0
+                for row in rows:
+                    writer.writerow([NULL if value is None else value for value in row])
+                    count += 1
+            counts[table.name] = count
+    finally:
+        snapshot.close()
+        os.remove(os.path.join(directory, "snapshot.db"))
+    return counts
+
+
+def _dump_postgres(bind: Engine, directory: str) -> dict[str, int]:
+    counts = {}
+    with bind.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        with conn.begin():
+            # Every COPY below reads the same snapshot
+            conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+            cursor = conn.connection.driver_connection.cursor()
+            for table in BACKUP_TABLES:
+                columns = ", ".join(_columns(table))
+                with open(os.path.join(directory, f"{table.name}.csv"), "w", newline="") as f:
+                    cursor.copy_expert(
+                        f"COPY {table.name} ({columns}) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '{NULL}')",
+                        f,
+                    )
+                counts[table.name] = conn.execute(select(func.count()).select_from(table)).scalar()
+    return counts
+
+
+def dump(path: str, bind: Engine = engine) -> dict[str, int]:
+    """Write a consistent compressed snapshot of the backed-up tables to path"""
+    with tempfile.TemporaryDirectory() as directory:
+        if bind.dialect.name == "postgresql":
+            counts = _dump_postgres(bind, directory)
+        else:
+            counts = _dump_sqlite(bind, directory)
+
+        manifest = {
+            "format": "it-inventory-dump",
+            "version": FORMAT_VERSION,
+            "dialect": bind.dialect.name,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "tables": [
+                {"name": table.name, "columns": _columns(table), "rows": counts[table.name]}
+                for table in BACKUP_TABLES
+            ],
+        }
+        with tarfile.open(path, "w:gz") as tar:
+            data = json.dumps(manifest, indent=2).encode()
+            info = tarfile.TarInfo("manifest.json")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+            for table in BACKUP_TABLES:
+                tar.add(os.path.join(directory, f"{table.name}.csv"), arcname=f"{table.name}.csv")
+    return counts
+
+
+def _load_sqlite(conn: Connection, table: Table, columns: list[str], f) -> None:
+    reader = csv.reader(io.TextIOWrapper(f, newline=""))
+    next(reader)  # header
+    rows = (tuple(None if value == NULL else value for value in row) for row in reader)
+    insert = f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    while batch := list(islice(rows, LOAD_BATCH_ROWS)):
+        conn.exec_driver_sql(insert, batch)
+
+
+def _load_postgres(conn: Connection, table: Table, columns: list[str], f) -> None:
+    cursor = conn.connection.driver_connection.cursor()
+    cursor.copy_expert(
+        f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true, NULL '{NULL}')",
+        f,
+    )
+    # Continue ids after the restored rows
+    conn.exec_driver_sql(
+        f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+        f"FROM {table.name}"
+    )
+
+
+def restore(path: str, bind: Engine = engine, replace: bool = False) -> dict[str, int]:
+    """Load a dump into the database; refuses to overwrite existing items unless replace"""
+    Base.metadata.create_all(bind=bind)
+
+    with tarfile.open(path, "r:gz") as tar:
+        manifest = json.load(tar.extractfile("manifest.json"))
+        if manifest.get("format") != "it-inventory-dump" or manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a supported inventory dump")
+        if manifest["dialect"] != bind.dialect.name:
+            raise ValueError(f"Dump was taken from {manifest['dialect']}, cannot restore into {bind.dialect.name}")
+
+        tables = [(Base.metadata.tables[entry["name"]], entry) for entry in manifest["tables"]]
+        load = _load_postgres if bind.dialect.name == "postgresql" else _load_sqlite
+
+        with bind.begin() as conn:
+            existing = conn.execute(select(func.count()).select_from(models.Item.__table__)).scalar()
+            if existing and not replace:
+                raise ValueError(f"Database already holds {existing} items; pass --replace to overwrite")
+            for table, _ in reversed(tables):
+                conn.execute(table.delete())
+
+            # Loading into unindexed tables and indexing once is far cheaper than per-row upkeep
+            for table, _ in tables:
+                for index in table.indexes:
+                    index.drop(conn, checkfirst=True)
+
+            for table, entry in tables:
+                load(conn, table, entry["columns"], tar.extractfile(f"{table.name}.csv"))
+
+            for table, _ in tables:
+                for index in table.indexes:
+                    index.create(conn)
+
+    with Session(bind=bind) as db:
+        versions.bump_all(db)
+        db.commit()
+
+    return {entry["name"]: entry["rows"] for _, entry in tables}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot or restore the inventory database")
+    parser.add_argument("action", choices=["dump", "restore"])
+    parser.add_argument("path", help="dump file (.tar.gz)")
+    parser.add_argument("--replace", action="store_true", help="restore over existing data")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        if args.action == "dump":
+            counts = dump(args.path)
+        else:
+            counts = restore(args.path, replace=args.replace)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        raise SystemExit(1)
+
+    elapsed = time.perf_counter() - started
+    summary = ", ".join(f"{name}: {rows}" for name, rows in counts.items())
+    print(f"[OK] {args.action} of {args.path} finished in {elapsed:.1f}s ({summary})")
+
+
+if __name__ == "__main__":
+    main()
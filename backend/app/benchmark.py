@@ -0,0 +1,412 @@
+"""
+Microbenchmarks for hot backend paths, run against a throwaway SQLite database.
+Run from the backend directory: python -m app.benchmark <name> [--items N]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from .database import Base, create_db_engine
+from .models import Item, ItemType, ItemStatus
+from . import backup, compression, crud, item_index, schemas, suggest, view_data
+
+LOCATIONS = [f"Room {n}" for n in range(100, 420)] + [
+    "IT Closet", "Storage Room", "Main Office", "Auditorium", "Media Cart",
+]
+NAMES = ["Chromebook", "Laptop", "Projector", "iPad", "HDMI Cable", "Charger", "Keyboard", "Mouse"]
+
+
+def synthetic_rows(count: int, seed: int = 42):
+    """Yield plausible item rows for bulk inserts"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    for n in range(count):
+        item_type = ItemType.part if n % 3 == 0 else ItemType.device
+        updated_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        yield {
+            "name": f"{rng.choice(NAMES)} {n:07d}",
+            "type": item_type,
+            "location": rng.choice(LOCATIONS),
+            "status": rng.choice(list(ItemStatus)),
+            "quantity": rng.randint(0, 40) if item_type == ItemType.part else 1,
+            "low_stock_threshold": 5,
+            "notes": f"Synthetic item {n}",
+            "created_at": updated_at,
+            "updated_at": updated_at,
+        }
+
+
+def make_database(count: int, batch_size: int = 10_000, sqlite_tuned: bool = False):
+    """Create a temporary SQLite database holding `count` synthetic items"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = create_db_engine(f"sqlite:///{path}", sqlite_tuned=sqlite_tuned)
+    Base.metadata.create_all(bind=engine)
+
+    rows = synthetic_rows(count)
+    with engine.begin() as conn:
+        while True:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            if not batch:
+                break
+            conn.execute(insert(Item), batch)
+
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Session() as db:
+        crud.sync_locations(db)
+    return engine, Session, path
+
+
+def timed(func, repeat: int) -> tuple[float, float]:
+    """Run func `repeat` times; return (wall, cpu) seconds per call"""
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - wall) / repeat, (time.process_time() - cpu) / repeat
+
+
+def bench_list_items(args):
+    """CPU per list request with and without the get_items statement cache"""
+    engine, Session, path = make_database(args.items)
+    filter_sets = [
+        {},
+        {"item_type": "part"},
+        {"status": "available", "location": "Room 2"},
+        {"search": "Chromebook", "item_type": "device"},
+    ]
+
+    try:
+        with Session() as db:
+            def run_all():
+                for filters in filter_sets:
+                    crud.get_items(db, limit=args.limit, **filters)
+
+            def run_all_uncached():
+                crud._items_statements.clear()
+                run_all()
+
+            run_all()
+            _, cold_cpu = timed(run_all_uncached, args.repeat)
+            _, warm_cpu = timed(run_all, args.repeat)
+
+        per_request = len(filter_sets)
+        print(f"list_items: {args.items} items, limit={args.limit}, {args.repeat} rounds")
+        print(f"  rebuilt statements: {cold_cpu / per_request * 1e6:9.1f} us CPU/request")
+        print(f"  cached statements:  {warm_cpu / per_request * 1e6:9.1f} us CPU/request")
+        print(f"  cache stats: {crud.get_statement_cache_stats()}")
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+def bench_item_index(args):
+    """Memory per item and list latency of the in-memory index against SQL"""
+    engine, Session, path = make_database(args.items)
+    filter_sets = {
+        "unfiltered": {},
+        "type": {"item_type": "part"},
+        "type+status": {"item_type": "device", "status": "broken"},
+        "location": {"location": "Room 2"},
+        "search": {"search": "Projector"},
+    }
+
+    try:
+        with Session() as db:
+            index = item_index.ItemIndex()
+            tracemalloc.start()
+            index.load(db)
+            used, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(f"item_index: {args.items} items, limit={args.limit}")
+            print(f"  memory: {used / args.items:.0f} bytes/item ({used / 2**20:.1f} MiB)")
+            for label, filters in filter_sets.items():
+                sql_wall, _ = timed(lambda: crud.get_items(db, limit=args.limit, **filters), args.repeat)
+                index_wall, _ = timed(lambda: index.query(limit=args.limit, **filters), args.repeat)
+                print(f"  {label:12s} sql {sql_wall * 1e3:8.2f} ms   index {index_wall * 1e3:8.3f} ms")
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+def bench_suggest(args):
+    """Prefix index build time and lookup latency for distinct item names"""
+    names = Counter(row["name"] for row in synthetic_rows(args.items))
+
+    started = time.perf_counter()
+    index = suggest.PrefixIndex(names)
+    build = time.perf_counter() - started
+
+    print(f"suggest: {len(names)} distinct names, {len(index.entries)} prefix entries")
+    print(f"  build: {build:.2f} s")
+    for prefix in ("c", "chrome", "hdmi cable 00", "0012", "zzz"):
+        wall, _ = timed(lambda: index.search(prefix, 8), args.repeat)
+        print(f"  {prefix!r:16s} {wall * 1e6:8.1f} us")
+
+    wall, _ = timed(lambda: (index.add("Zebra Printer"), index.remove("Zebra Printer")), args.repeat)
+    print(f"  add+remove: {wall * 1e6:8.1f} us")
+
+
+def bench_list_page(args):
+    """CPU and peak memory to load and serialize one large list page"""
+    engine, Session, path = make_database(args.items)
+    adapter = TypeAdapter(list[schemas.ItemResponse])
+
+    def orm_page(db):
+        # Previous path: ORM entities, then per-row validation via from_attributes
+        items = db.execute(
+            select(Item).order_by(Item.updated_at.desc()).limit(args.limit)
+        ).scalars().all()
+        return adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+
+    def tuple_page(db):
+        return to_json(crud.get_items(db, limit=args.limit))
+
+    try:
+        print(f"list_page: {args.items} items, limit={args.limit}, {args.repeat} rounds")
+        for label, page in (("orm + validate", orm_page), ("tuples + to_json", tuple_page)):
+            with Session() as db:
+                page(db)
+                _, cpu = timed(lambda: page(db), args.repeat)
+            with Session() as db:
+                tracemalloc.start()
+                page(db)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            print(f"  {label:17s} {cpu * 1e3:7.2f} ms CPU/page   peak {peak / 2**20:6.2f} MiB")
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+def bench_sqlite_concurrency(args):
+    """Mixed read/write throughput of default SQLite settings vs the tuned mode"""
+    write_ratio = 0.2
+
+    def run(sqlite_tuned: bool):
+        engine, Session, path = make_database(args.items, sqlite_tuned=sqlite_tuned)
+        # Tuned mode funnels writes through one lock, as get_db does for write requests
+        write_lock = threading.Lock() if sqlite_tuned else nullcontext()
+        counts = {"reads": 0, "writes": 0, "locked": 0}
+        counts_lock = threading.Lock()
+        deadline = time.perf_counter() + args.seconds
+
+        def worker(seed: int):
+            rng = random.Random(seed)
+            with Session() as db:
+                while time.perf_counter() < deadline:
+                    kind = "writes" if rng.random() < write_ratio else "reads"
+                    try:
+                        if kind == "writes":
+                            with write_lock:
+                                db.execute(
+                                    update(Item)
+                                    .where(Item.id == rng.randint(1, args.items))
+                                    .values(quantity=rng.randint(0, 40))
+                                )
+                                db.commit()
+                        else:
+                            crud.get_items(db, limit=20, status=rng.choice(list(ItemStatus)).value)
+                            db.rollback()  # end the read transaction, as a request would
+                    except OperationalError:
+                        db.rollback()
+                        kind = "locked"
+                    with counts_lock:
+                        counts[kind] += 1
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            engine.dispose()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        return counts
+
+    print(f"sqlite_concurrency: {args.items} items, {args.threads} threads, {args.seconds}s, {write_ratio:.0%} writes")
+    for label, sqlite_tuned in (("default", False), ("tuned", True)):
+        counts = run(sqlite_tuned)
+        ops = counts["reads"] + counts["writes"]
+        print(
+            f"  {label:8s} {ops / args.seconds:8.0f} ops/s   "
+            f"reads {counts['reads']:6d}  writes {counts['writes']:6d}  locked errors {counts['locked']}"
+        )
+
+
+def bench_backup(args):
+    """Dump and restore time, archive size and writes that land while a dump runs"""
+    engine, Session, path = make_database(args.items, sqlite_tuned=True)
+    fd, archive = tempfile.mkstemp(suffix=".tar.gz")
+    os.close(fd)
+    target, _, target_path = make_database(0)
+
+    writes = 0
+    dumping = threading.Event()
+
+    def writer():
+        nonlocal writes
+        rng = random.Random(7)
+        with Session() as db:
+            while dumping.is_set():
+                db.execute(update(Item).where(Item.id == rng.randint(1, args.items)).values(quantity=rng.randint(0, 40)))
+                db.commit()
+                writes += 1
+
+    try:
+        dumping.set()
+        thread = threading.Thread(target=writer)
+        thread.start()
+        started = time.perf_counter()
+        counts = backup.dump(archive, bind=engine)
+        dump_wall = time.perf_counter() - started
+        dumping.clear()
+        thread.join()
+
+        started = time.perf_counter()
+        backup.restore(archive, bind=target, replace=True)
+        restore_wall = time.perf_counter() - started
+
+        rows = sum(counts.values())
+        print(f"backup: {args.items} items, {rows} rows across {len(counts)} tables")
+        print(f"  dump:    {dump_wall:6.2f} s   {os.path.getsize(archive) / 2**20:7.1f} MiB   "
+              f"{writes} concurrent writes committed")
+        print(f"  restore: {restore_wall:6.2f} s   {rows / restore_wall:9.0f} rows/s")
+    finally:
+        engine.dispose()
+        target.dispose()
+        for file in (archive, path, target_path, path + "-wal", path + "-shm"):
+            if os.path.exists(file):
+                os.remove(file)
+
+
+def bench_view_data(args):
+    """Time to first output, total time and peak memory of the full view_data report"""
+    engine, Session, path = make_database(args.items)
+
+    class FirstWrite:
+        # Stands in for the terminal: discards output, remembers when the first byte arrived
+        def __init__(self, out):
+            self.out, self.first = out, None
+
+        def write(self, text):
+            if self.first is None:
+                self.first = time.perf_counter()
+            return self.out.write(text)
+
+    def load_all(db, out):
+        # Previous path: every item as an ORM entity, then Python passes for each section
+        items = db.query(Item).order_by(Item.type, Item.name).all()
+        devices = [i for i in items if i.type == ItemType.device]
+        parts = [i for i in items if i.type == ItemType.part]
+        for item in devices:
+            out.write(f"{view_data.STATUS_ICONS.get(item.status, '[?]')} {item.name}\n{item.location}\n{item.notes}\n\n")
+        for item in parts:
+            out.write(f"{item.name}\n{item.quantity} ({item.low_stock_threshold})\n{item.location}\n\n")
+        status_counts = {status: len([i for i in items if i.status == status]) for status in ItemStatus}
+        low_stock = [p for p in parts if p.quantity <= p.low_stock_threshold]
+        out.write(f"{len(items)} {len(devices)} {len(parts)} {status_counts} {len(low_stock)}\n")
+        for item in low_stock:
+            out.write(f"    - {item.name} (only {item.quantity} left)\n")
+
+    def stream(db, out):
+        conditions = view_data.item_filters()
+        view_data.write_table(db, conditions, view_data.summarize(db, conditions), out)
+
+    try:
+        print(f"view_data: {args.items} items")
+        with open(os.devnull, "w") as devnull:
+            for label, report in (("load all", load_all), ("streamed", stream)):
+                with Session() as db:
+                    out = FirstWrite(devnull)
+                    started = time.perf_counter()
+                    report(db, out)
+                    wall = time.perf_counter() - started
+                    first = out.first - started
+                with Session() as db:
+                    tracemalloc.start()
+                    report(db, devnull)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                print(f"  {label:9s} first output {first * 1e3:9.1f} ms   total {wall:6.2f} s   peak {peak / 2**20:7.1f} MiB")
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+def bench_list_wire(args):
+    """Bytes on the wire and server time for one list page, by projection and encoding"""
+    engine, Session, path = make_database(args.items)
+    projections = {
+        "all fields": crud.ITEM_FIELDS,
+        "card fields": crud.item_fields(["name", "type", "location", "status", "quantity", "low_stock_threshold"]),
+    }
+    # Time to transfer the body on a congested school link
+    link_bytes_per_second = 2 * 10**6 / 8
+
+    try:
+        print(f"list_wire: {args.items} items, limit={args.limit}, {args.repeat} rounds, transfer at 2 Mbit/s")
+        with Session() as db:
+            for label, fields in projections.items():
+                for encoding in ("identity", "gzip", "br"):
+                    def page():
+                        body = to_json(crud.get_items(db, limit=args.limit, fields=fields))
+                        if encoding != "identity":
+                            body = compression._Encoder(encoding).chunk(body, more=False)
+                        return body
+
+                    size = len(page())
+                    wall, _ = timed(page, args.repeat)
+                    transfer = size / link_bytes_per_second
+                    print(
+                        f"  {label:11s} {encoding:8s} {size / 1024:8.1f} KiB   server {wall * 1e3:6.2f} ms"
+                        f"   + transfer {transfer * 1e3:7.1f} ms"
+                    )
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+BENCHMARKS = {
+    "backup": bench_backup,
+    "list-items": bench_list_items,
+    "list-wire": bench_list_wire,
+    "item-index": bench_item_index,
+    "list-page": bench_list_page,
+    "suggest": bench_suggest,
+    "sqlite-concurrency": bench_sqlite_concurrency,
+    "view-data": bench_view_data,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--items", type=int, default=10_000, help="rows in the benchmark database")
+    parser.add_argument("--limit", type=int, default=100, help="page size for list queries")
+    parser.add_argument("--repeat", type=int, default=200, help="rounds per measurement")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent workers")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of throughput runs")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == "__main__":
+    main()
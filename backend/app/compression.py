@@ -0,0 +1,130 @@
+"""
+Response compression for clients on slow links.
+Bodies of at least COMPRESS_MIN_BYTES are sent brotli- or gzip-encoded,
+whichever the client's Accept-Encoding prefers (brotli on a tie), and
+streamed responses are compressed chunk by chunk as they are produced.
+"""
+
+import os
+import zlib
+from typing import Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Smaller bodies fit in a packet or two anyway; compressing them only costs CPU
+MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+# Fast settings: JSON compresses well even at low levels, and latency matters more
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q-values"""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip()] = q
+
+    best = None
+    for coding in ("br", "gzip"):
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._flush = self._compressor.flush
+            self._finish = self._compressor.finish
+            self._compress = self._compressor.process
+        else:
+            # wbits=31 writes the gzip header and trailer
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+            self._compress = self._compressor.compress
+
+    def chunk(self, data: bytes, more: bool) -> bytes:
+        # Flush each streamed chunk so the client can start parsing before the end
+        return self._compress(data) + (self._flush() if more else self._finish())
+
+
+class CompressionMiddleware:
+    """Compress large compressible responses for clients that accept br or gzip"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        pending = b""
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, pending, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            more = message.get("more_body", False)
+            if encoder is None:
+                # Hold back the headers until the body is known to be worth compressing
+                pending += message.get("body", b"")
+                if len(pending) < self.minimum_size:
+                    if more:
+                        return
+                    await send(start)
+                    await send({"type": "http.response.body", "body": pending})
+                    return
+
+                encoder = _Encoder(encoding)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Length"]
+                await send(start)
+                body, pending = pending, b""
+            else:
+                body = message.get("body", b"")
+
+            await send({"type": "http.response.body", "body": encoder.chunk(body, more), "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,12 +1,143 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+import json
+import re
+import time
+from datetime import datetime, timezone
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import Select, bindparam, func, or_, select, update
 from typing import Optional
 
-from . import models, schemas
+from . import database, item_index, models, schemas, stock, suggest, versions
+from .database import DEFAULT_TENANT
 
 
-def get_item(db: Session, item_id: int) -> Optional[models.Item]:
-    return db.query(models.Item).filter(models.Item.id == item_id).first()
+# Soft-deleted items keep their row until purged; every read filters them out
+LIVE_ITEMS = models.Item.deleted_at.is_(None)
+
+
+def get_item(
+    db: Session,
+    item_id: int,
+    tenant_id: str = DEFAULT_TENANT,
+    include_deleted: bool = False,
+) -> Optional[models.Item]:
+    query = db.query(models.Item).filter(models.Item.id == item_id, models.Item.tenant_id == tenant_id)
+    if not include_deleted:
+        query = query.filter(LIVE_ITEMS)
+    return query.first()
+
+
+# Columns get_items selects, in ItemResponse field order
+ITEM_FIELDS = tuple(schemas.ItemResponse.model_fields)
+
+# Statements for get_items/count_items, keyed by shape ("page" or "bounded_count"),
+# the projected fields and which filters are active. Values, including the tenant,
+# are passed as bound parameters, so each shape is built (and compiled) once.
+_items_statements: dict[tuple, Select] = {}
+_items_statement_stats = {"hits": 0, "misses": 0}
+ITEM_STATEMENT_CACHE_SIZE = 1000
+
+# Totals up to this many rows are counted exactly; larger ones are estimated
+COUNT_EXACT_THRESHOLD = 10_000
+
+# How long an exact count of a large result is reused as an estimate
+COUNT_CACHE_SECONDS = 60.0
+
+COUNT_CACHE_SIZE = 1000
+_count_cache: dict[tuple, tuple[float, int]] = {}
+
+
+def _filter_items(stmt: Select, active: tuple[str, ...]) -> Select:
+    stmt = stmt.where(models.Item.tenant_id == bindparam("tenant_id"), LIVE_ITEMS)
+    
+    if "search" in active:
+        search = bindparam("search")
+        stmt = stmt.where(
+            or_(
+                models.Item.name.ilike(search),
+                models.Item.location.ilike(search),
+                models.Item.notes.ilike(search),
+            )
+        )
+
+    if "item_type" in active:
+        stmt = stmt.where(models.Item.type == bindparam("item_type"))
+
+    if "status" in active:
+        stmt = stmt.where(models.Item.status == bindparam("status"))
+
+    if "location" in active:
+        # Match against the small locations table, then use the indexed location_id
+        stmt = stmt.where(
+            models.Item.location_id.in_(
+                select(models.Location.id).where(
+                    models.Location.tenant_id == bindparam("tenant_id"),
+                    models.Location.name.ilike(bindparam("location")),
+                )
+            )
+        )
+
+    return stmt
+
+
+def item_fields(fields: Optional[list[str]]) -> Optional[tuple[str, ...]]:
+    """Requested fields in ITEM_FIELDS order, always with id; None if any is unknown"""
+    if not fields:
+        return ITEM_FIELDS
+    if not set(fields) <= set(ITEM_FIELDS):
+        return None
+    return tuple(field for field in ITEM_FIELDS if field == "id" or field in fields)
+
+
+def _items_statement(shape: str, active: tuple[str, ...], fields: tuple[str, ...] = ITEM_FIELDS) -> Select:
+    key = (shape, fields, *active)
+    stmt = _items_statements.get(key)
+    if stmt is not None:
+        _items_statement_stats["hits"] += 1
+        return stmt
+    _items_statement_stats["misses"] += 1
+
+    if shape == "bounded_count":
+        # Stops counting one past the threshold instead of scanning every match
+        matches = _filter_items(select(models.Item.id), active).limit(COUNT_EXACT_THRESHOLD + 1)
+        stmt = select(func.count()).select_from(matches.subquery())
+    else:
+        # Plain columns rather than the entity: no identity map or change tracking per row,
+        # and only the projected ones, so unused columns such as notes are never read
+        stmt = _filter_items(select(*[getattr(models.Item, field) for field in fields]), active)
+        stmt = (
+            stmt.order_by(models.Item.updated_at.desc())
+            .offset(bindparam("skip"))
+            .limit(bindparam("limit"))
+        )
+
+    if len(_items_statements) >= ITEM_STATEMENT_CACHE_SIZE:
+        _items_statements.clear()
+    _items_statements[key] = stmt
+    return stmt
+
+
+def _item_filter_params(
+    search: Optional[str],
+    item_type: Optional[str],
+    status: Optional[str],
+    location: Optional[str],
+) -> tuple[dict, tuple[str, ...]]:
+    params = {}
+    
+    if search:
+        params["search"] = f"%{search}%"
+    
+    if item_type:
+        params["item_type"] = item_type
+    
+    if status:
+        params["status"] = status
+    
+    if location:
+        params["location"] = f"%{location}%"
+    
+    return params, tuple(params)
 
 
 def get_items(
@@ -17,74 +148,346 @@ def get_items(
     item_type: Optional[str] = None,
     status: Optional[str] = None,
     location: Optional[str] = None,
-) -> list[models.Item]:
-    query = db.query(models.Item)
+    tenant_id: str = DEFAULT_TENANT,
+    fields: tuple[str, ...] = ITEM_FIELDS,
+) -> list[dict]:
+    """The tenant's matching items as plain dicts keyed by fields (see item_fields), newest update first"""
+    if item_index.ENABLED:
+        records = item_index.get(tenant_id).query(skip, limit, search, item_type, status, location)
+        return [{field: getattr(record, field) for field in fields} for record in records]
     
-    if search:
-        query = query.filter(
-            or_(
-                models.Item.name.ilike(f"%{search}%"),
-                models.Item.location.ilike(f"%{search}%"),
-                models.Item.notes.ilike(f"%{search}%"),
-            )
-        )
+    params, active = _item_filter_params(search, item_type, status, location)
+    params.update(tenant_id=tenant_id, skip=skip, limit=limit)
+    rows = db.execute(_items_statement("page", active, fields), params).tuples()
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def count_items(
+    db: Session,
+    search: Optional[str] = None,
+    item_type: Optional[str] = None,
+    status: Optional[str] = None,
+    location: Optional[str] = None,
+    tenant_id: str = DEFAULT_TENANT,
+) -> tuple[int, bool]:
+    """Total matches for the get_items filters, and whether the total is an estimate"""
+    if item_index.ENABLED:
+        return item_index.get(tenant_id).count(search, item_type, status, location), False
     
-    if item_type:
-        query = query.filter(models.Item.type == item_type)
+    params, active = _item_filter_params(search, item_type, status, location)
+    params["tenant_id"] = tenant_id
+    total = db.execute(_items_statement("bounded_count", active), params).scalar()
+    if total <= COUNT_EXACT_THRESHOLD:
+        return total, False
     
-    if status:
-        query = query.filter(models.Item.status == status)
+    # Large result: prefer the planner's estimate, else a recent exact count
+    if db.get_bind().dialect.name == "postgresql":
+        return _planner_estimate(db, active, params), True
     
-    if location:
-        query = query.filter(models.Item.location.ilike(f"%{location}%"))
+    key = tuple(sorted(params.items()))
+    cached = _count_cache.get(key)
+    if cached and time.monotonic() - cached[0] < COUNT_CACHE_SECONDS:
+        return cached[1], True
     
-    return query.order_by(models.Item.updated_at.desc()).offset(skip).limit(limit).all()
+    filtered = _filter_items(select(models.Item.id), active).subquery()
+    total = db.execute(select(func.count()).select_from(filtered), params).scalar()
+    if len(_count_cache) >= COUNT_CACHE_SIZE:
+        _count_cache.clear()
+    _count_cache[key] = (time.monotonic(), total)
+    return total, True
+
+
+def _planner_estimate(db: Session, active: tuple[str, ...], params: dict) -> int:
+    conn = db.connection()
+    compiled = _filter_items(select(models.Item.id), active).compile(dialect=conn.dialect)
+    plan = conn.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + compiled.string,
+        compiled.construct_params(params),
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
 
 
-def create_item(db: Session, item: schemas.ItemCreate) -> models.Item:
-    db_item = models.Item(**item.model_dump())
+def _hit_rate(counters: dict) -> float:
+    lookups = counters["hits"] + counters["misses"]
+    return counters["hits"] / lookups if lookups else 0.0
+
+
+def get_statement_cache_stats() -> dict:
+    """Hit rates for the get_items statement cache and SQLAlchemy's compiled cache"""
+    compiled = database.compile_cache_stats()
+    return {
+        "statements": {
+            **_items_statement_stats,
+            "size": len(_items_statements),
+            "hit_rate": _hit_rate(_items_statement_stats),
+        },
+        "compiled": {
+            **compiled,
+            "hit_rate": _hit_rate(compiled),
+        },
+    }
+
+
+def create_item(db: Session, item: schemas.ItemCreate, tenant_id: str = DEFAULT_TENANT) -> models.Item:
+    data = item.model_dump()
+    location = get_or_create_location(db, data["location"], tenant_id)
+    data["location"] = location.name if location else None
+    
+    db_item = models.Item(**data, tenant_id=tenant_id, location_id=location.id if location else None)
     db.add(db_item)
+    db.flush()
+    stock.opening_balance(db, db_item)
+    _adjust_location_count(db, db_item.location_id, 1)
+    version = versions.bump(db, tenant_id)
     db.commit()
     db.refresh(db_item)
+    item_index.apply(db_item, version)
+    suggest.item_created(db_item, version)
     return db_item
 
 
-def update_item(db: Session, item_id: int, item: schemas.ItemUpdate) -> Optional[models.Item]:
-    db_item = get_item(db, item_id)
+def update_item(
+    db: Session,
+    item_id: int,
+    item: schemas.ItemUpdate,
+    tenant_id: str = DEFAULT_TENANT,
+) -> Optional[models.Item]:
+    db_item = get_item(db, item_id, tenant_id)
     if not db_item:
         return None
     
+    before = suggest.snapshot(db_item)
     update_data = item.model_dump(exclude_unset=True)
+    if update_data.get("status") is not None:
+        # checked_out is only entered and left through checkout/checkin, which keep the
+        # checkouts table in step; here it may only be kept as it is
+        status = update_data.pop("status")
+        if status == models.ItemStatus.checked_out:
+            guard = models.Item.status == models.ItemStatus.checked_out
+        else:
+            guard = models.Item.status != models.ItemStatus.checked_out
+        changed = db.execute(
+            update(models.Item)
+            .where(models.Item.id == item_id, guard)
+            .values(status=status, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not changed:
+            db.rollback()
+            return None
+
+    if "location" in update_data:
+        location = get_or_create_location(db, update_data["location"], tenant_id)
+        update_data["location"] = location.name if location else None
+        location_id = location.id if location else None
+        if location_id != db_item.location_id:
+            _adjust_location_count(db, db_item.location_id, -1)
+            _adjust_location_count(db, location_id, 1)
+            db_item.location_id = location_id
+    
+    # A part's quantity is its ledger balance: an edited count is recorded as an adjustment,
+    # and a change of type opens or closes the ledger
+    was_part = db_item.type == models.ItemType.part
+    is_part = update_data.get("type", db_item.type) == models.ItemType.part
+    quantity = None
+    if was_part and is_part and update_data.get("quantity") is not None:
+        quantity = update_data.pop("quantity")
+    elif was_part and not is_part:
+        stock.closing_balance(db, db_item)
+    
     for key, value in update_data.items():
         setattr(db_item, key, value)
     
+    if quantity is not None:
+        stock.set_quantity(db, db_item, quantity, "Edited")
+    elif is_part and not was_part:
+        db.flush()
+        stock.opening_balance(db, db_item)
+    
+    version = versions.bump(db, tenant_id)
     db.commit()
     db.refresh(db_item)
+    item_index.apply(db_item, version)
+    suggest.item_updated(before, db_item, version)
     return db_item
 
 
-def delete_item(db: Session, item_id: int) -> bool:
-    db_item = get_item(db, item_id)
+def delete_item(db: Session, item_id: int, tenant_id: str = DEFAULT_TENANT) -> bool:
+    """Soft-delete an item; its row and checkout history stay until purged"""
+    db_item = get_item(db, item_id, tenant_id)
     if not db_item:
         return False
     
-    db.delete(db_item)
+    before = suggest.snapshot(db_item)
+    deleted = db.execute(
+        update(models.Item)
+        .where(models.Item.id == item_id, LIVE_ITEMS)
+        .values(deleted_at=func.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not deleted:
+        # Deleted concurrently by another request
+        db.rollback()
+        return False
+    
+    _adjust_location_count(db, db_item.location_id, -1)
+    version = versions.bump(db, tenant_id)
     db.commit()
+    item_index.discard(item_id, tenant_id, version)
+    suggest.item_deleted(before, version)
     return True
 
 
-def get_dashboard_stats(db: Session) -> dict:
-    total_items = db.query(models.Item).count()
-    total_devices = db.query(models.Item).filter(models.Item.type == "device").count()
-    total_parts = db.query(models.Item).filter(models.Item.type == "part").count()
+def restore_item(db: Session, item_id: int, tenant_id: str = DEFAULT_TENANT) -> Optional[models.Item]:
+    """Bring back a soft-deleted item; None if there is no such deleted item"""
+    db_item = get_item(db, item_id, tenant_id, include_deleted=True)
+    if not db_item or db_item.deleted_at is None:
+        return None
+    
+    restored = db.execute(
+        update(models.Item)
+        .where(models.Item.id == item_id, models.Item.deleted_at.isnot(None))
+        .values(deleted_at=None, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not restored:
+        db.rollback()
+        return None
+    
+    _adjust_location_count(db, db_item.location_id, 1)
+    version = versions.bump(db, tenant_id)
+    db.commit()
+    db.refresh(db_item)
+    item_index.apply(db_item, version)
+    suggest.item_created(db_item, version)
+    return db_item
+
+
+def _set_item_status(db: Session, db_item: models.Item, status: models.ItemStatus, unless: models.ItemStatus) -> bool:
+    """Conditionally flip an item's status; False if it was already `unless`"""
+    return db.execute(
+        update(models.Item)
+        .where(models.Item.id == db_item.id, models.Item.status != unless)
+        .values(status=status, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def checkout_item(db: Session, db_item: models.Item, checkout: schemas.CheckoutCreate) -> Optional[models.Checkout]:
+    """Open a checkout and mark the item checked out; None if it already is"""
+    before = suggest.snapshot(db_item)
+    if not _set_item_status(db, db_item, models.ItemStatus.checked_out, unless=models.ItemStatus.checked_out):
+        db.rollback()
+        return None
+    
+    db_checkout = models.Checkout(tenant_id=db_item.tenant_id, item_id=db_item.id, **checkout.model_dump())
+    db.add(db_checkout)
+    try:
+        db.flush()
+    except IntegrityError:
+        # Another request opened a checkout for this item first
+        db.rollback()
+        return None
+    version = versions.bump(db, db_item.tenant_id)
+    db.commit()
+    
+    db.refresh(db_item)
+    item_index.apply(db_item, version)
+    suggest.item_updated(before, db_item, version)
+    db.refresh(db_checkout)
+    return db_checkout
+
+
+def checkin_item(db: Session, db_item: models.Item) -> Optional[models.Checkout]:
+    """Close the item's open checkout and make it available; None if none is open"""
+    db_checkout = db.execute(
+        select(models.Checkout)
+        .where(models.Checkout.item_id == db_item.id, models.Checkout.returned_at.is_(None))
+    ).scalar_one_or_none()
+    if not db_checkout:
+        return None
+    
+    before = suggest.snapshot(db_item)
+    closed = db.execute(
+        update(models.Checkout)
+        .where(models.Checkout.id == db_checkout.id, models.Checkout.returned_at.is_(None))
+        .values(returned_at=func.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not closed:
+        db.rollback()
+        return None
+    
+    _set_item_status(db, db_item, models.ItemStatus.available, unless=models.ItemStatus.available)
+    version = versions.bump(db, db_item.tenant_id)
+    db.commit()
+    
+    db.refresh(db_item)
+    item_index.apply(db_item, version)
+    suggest.item_updated(before, db_item, version)
+    db.refresh(db_checkout)
+    return db_checkout
+
+
+def get_checkouts(
+    db: Session,
+    assignee: Optional[str] = None,
+    open_only: bool = False,
+    overdue: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+    tenant_id: str = DEFAULT_TENANT,
+) -> list[models.Checkout]:
+    query = (
+        select(models.Checkout)
+        .join(models.Checkout.item)
+        .options(contains_eager(models.Checkout.item))
+        .where(models.Checkout.tenant_id == tenant_id, LIVE_ITEMS)
+    )
+    
+    if assignee:
+        query = query.where(models.Checkout.assignee == assignee)
+    
+    if open_only or overdue:
+        query = query.where(models.Checkout.returned_at.is_(None))
+    
+    if overdue:
+        query = query.where(models.Checkout.due_at < func.now())
+        order = models.Checkout.due_at
+    else:
+        order = models.Checkout.out_at.desc()
+    
+    return db.execute(query.order_by(order).offset(skip).limit(limit)).scalars().all()
+
+
+def get_job(db: Session, job_id: int, tenant_id: str = DEFAULT_TENANT) -> Optional[models.Job]:
+    job = db.get(models.Job, job_id)
+    return job if job and job.tenant_id == tenant_id else None
+
+
+def create_job(db: Session, job: schemas.JobCreate, tenant_id: str = DEFAULT_TENANT) -> models.Job:
+    db_job = models.Job(tenant_id=tenant_id, kind=job.kind, params=json.dumps(job.params))
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+
+def get_dashboard_stats(db: Session, tenant_id: str = DEFAULT_TENANT) -> dict:
+    items = db.query(models.Item).filter(models.Item.tenant_id == tenant_id, LIVE_ITEMS)
+    total_items = items.count()
+    total_devices = items.filter(models.Item.type == "device").count()
+    total_parts = items.filter(models.Item.type == "part").count()
     
-    available_count = db.query(models.Item).filter(models.Item.status == "available").count()
-    in_use_count = db.query(models.Item).filter(models.Item.status == "in_use").count()
-    broken_count = db.query(models.Item).filter(models.Item.status == "broken").count()
-    checked_out_count = db.query(models.Item).filter(models.Item.status == "checked_out").count()
+    available_count = items.filter(models.Item.status == "available").count()
+    in_use_count = items.filter(models.Item.status == "in_use").count()
+    broken_count = items.filter(models.Item.status == "broken").count()
+    checked_out_count = items.filter(models.Item.status == "checked_out").count()
     
     # Get items where quantity is below low_stock_threshold (only for parts)
-    low_stock_items = db.query(models.Item).filter(
+    low_stock_items = items.filter(
         models.Item.type == "part",
         models.Item.quantity <= models.Item.low_stock_threshold
     ).all()
@@ -101,7 +504,160 @@ def get_dashboard_stats(db: Session) -> dict:
     }
 
 
-def get_unique_locations(db: Session) -> list[str]:
+def get_trends(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    bucket: str,
+    tenant_id: str = DEFAULT_TENANT,
+) -> list[dict]:
+    """Snapshot counts per bucket between start and end, read only from stats_snapshots"""
+    # Bounds without an offset are UTC. SQLite keeps bucket_start as naive UTC text and compares
+    # bounds as text, so there they must be naive UTC too; Postgres compares instants
+    start, end = (
+        moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+        for moment in (start, end)
+    )
+    if db.get_bind().dialect.name == "sqlite":
+        start, end = start.replace(tzinfo=None), end.replace(tzinfo=None)
+    rows = db.execute(
+        select(
+            models.StatsSnapshot.bucket_start,
+            models.StatsSnapshot.dimension,
+            models.StatsSnapshot.value,
+            models.StatsSnapshot.count,
+        )
+        .where(
+            models.StatsSnapshot.tenant_id == tenant_id,
+            models.StatsSnapshot.bucket == bucket,
+            models.StatsSnapshot.bucket_start >= start,
+            models.StatsSnapshot.bucket_start <= end,
+        )
+        .order_by(models.StatsSnapshot.bucket_start)
+    )
+    
+    points: dict[datetime, dict] = {}
+    for bucket_start, dimension, value, count in rows:
+        point = points.setdefault(
+            bucket_start,
+            {"bucket_start": bucket_start, "type": {}, "status": {}, "location": {}},
+        )
+        point[dimension][value] = count
+    return list(points.values())
+
+
+def get_unique_locations(db: Session, tenant_id: str = DEFAULT_TENANT) -> list[str]:
     """Get all unique locations for filter dropdown"""
-    locations = db.query(models.Item.location).distinct().filter(models.Item.location.isnot(None)).all()
-    return [loc[0] for loc in locations if loc[0]]
+    return db.execute(
+        select(models.Location.name)
+        .where(models.Location.tenant_id == tenant_id, models.Location.item_count > 0)
+        .order_by(models.Location.name)
+    ).scalars().all()
+
+
+def get_location_summaries(db: Session, tenant_id: str = DEFAULT_TENANT) -> list[models.Location]:
+    """Locations in use, grouped by building, with their item counts"""
+    return db.execute(
+        select(models.Location)
+        .where(models.Location.tenant_id == tenant_id, models.Location.item_count > 0)
+        .order_by(models.Location.building, models.Location.room, models.Location.name)
+    ).scalars().all()
+
+
+# "Room 205", "Annex, Room 12" or "Main Building - Room 3B"
+_ROOM_PATTERN = re.compile(r"^(?:(?P<building>.+?)\s*[,/-]\s*)?Room\s+(?P<room>[\w-]+)$", re.IGNORECASE)
+
+
+def normalize_location(name: Optional[str]) -> Optional[str]:
+    """Trim and collapse whitespace; a blank name means no location"""
+    if name is None:
+        return None
+    return " ".join(name.split()) or None
+
+
+def parse_location(name: str) -> tuple[Optional[str], Optional[str]]:
+    """Split a location name into (building, room) where it follows a room pattern"""
+    match = _ROOM_PATTERN.match(name)
+    if not match:
+        return None, None
+    return match.group("building"), match.group("room")
+
+
+def get_or_create_location(
+    db: Session,
+    name: Optional[str],
+    tenant_id: str = DEFAULT_TENANT,
+) -> Optional[models.Location]:
+    name = normalize_location(name)
+    if name is None:
+        return None
+    
+    key = name.lower()
+    query = select(models.Location).where(models.Location.tenant_id == tenant_id, models.Location.key == key)
+    location = db.execute(query).scalar_one_or_none()
+    if location:
+        return location
+    
+    building, room = parse_location(name)
+    try:
+        with db.begin_nested():
+            location = models.Location(
+                tenant_id=tenant_id, name=name, key=key, building=building, room=room, item_count=0
+            )
+            db.add(location)
+    except IntegrityError:
+        # Created concurrently by another request
+        location = db.execute(query).scalar_one()
+    return location
+
+
+def _adjust_location_count(db: Session, location_id: Optional[int], delta: int) -> None:
+    if location_id is None:
+        return
+    db.execute(
+        update(models.Location)
+        .where(models.Location.id == location_id)
+        .values(item_count=models.Location.item_count + delta)
+    )
+
+
+def sync_locations(db: Session) -> int:
+    """Link items that only have a location string, then recount live items per location.
+
+    Returns the number of distinct location strings that were linked.
+    """
+    unlinked = db.execute(
+        select(models.Item.tenant_id, models.Item.location)
+        .where(models.Item.location_id.is_(None), models.Item.location.isnot(None))
+        .distinct()
+    ).all()
+    
+    for tenant_id, raw in unlinked:
+        location = get_or_create_location(db, raw, tenant_id)
+        db.execute(
+            update(models.Item)
+            .where(
+                models.Item.tenant_id == tenant_id,
+                models.Item.location == raw,
+                models.Item.location_id.is_(None),
+            )
+            .values(
+                location_id=location.id if location else None,
+                location=location.name if location else None,
+                # Backfilling must not reorder the list
+                updated_at=models.Item.updated_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    # updated_at stays put above, so only the counter tells the read models the names changed
+    for tenant_id in {tenant_id for tenant_id, _ in unlinked}:
+        versions.bump(db, tenant_id)
+    
+    item_count = (
+        select(func.count(models.Item.id))
+        .where(models.Item.location_id == models.Location.id, LIVE_ITEMS)
+        .scalar_subquery()
+    )
+    db.execute(update(models.Location).values(item_count=item_count))
+    db.commit()
+    return len(unlinked)
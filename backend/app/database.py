@@ -1,7 +1,19 @@
+import asyncio
+import itertools
 import os
-from sqlalchemy import create_engine
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import anyio
+from fastapi import HTTPException, Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import default
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
 
 # Use PostgreSQL in production (Vercel), SQLite in development
 DATABASE_URL = os.getenv(
@@ -9,31 +21,224 @@ DATABASE_URL = os.getenv(
     "sqlite:///./inventory.db"
 )
 
-# Handle Vercel Postgres URL format (needs to be modified for SQLAlchemy)
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# Optional read replicas, comma separated (e.g. "postgres://replica1/db,postgres://replica2/db")
+REPLICA_URLS = [url.strip() for url in os.getenv("POSTGRES_REPLICA_URLS", "").split(",") if url.strip()]
+
+# After a client writes, its reads stay on the primary this long so replica lag can't hide the write
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Production settings for single-node SQLite deployments
+SQLITE_TUNED = os.getenv("SQLITE_TUNED", "0") == "1"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 2**20))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", str(-64 * 1024))),  # negative means KiB
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY",
+}
+# How often the tuned mode runs PRAGMA optimize and checkpoints the WAL
+SQLITE_MAINTENANCE_SECONDS = float(os.getenv("SQLITE_MAINTENANCE_SECONDS", "3600"))
+
+# Tenant (school) for requests without an X-Tenant-Id header, and for existing rows
+DEFAULT_TENANT = "default"
+_TENANT_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,50}$")
+
+# Serializes write requests in tuned SQLite mode; WAL lets reads run alongside.
+# Queued writers wait on the event loop, so they never tie up threadpool threads
+sqlite_write_lock = anyio.Lock()
+
+
+def normalize_url(url: str) -> str:
+    # Handle Vercel Postgres URL format (needs to be modified for SQLAlchemy)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+DATABASE_URL = normalize_url(DATABASE_URL)
+REPLICA_URLS = [normalize_url(url) for url in REPLICA_URLS]
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def create_db_engine(url: str, sqlite_tuned: bool = SQLITE_TUNED):
+    # Configure engine based on database type
+    if url.startswith("sqlite"):
+        sqlite_engine = create_engine(
+            url, connect_args={"check_same_thread": False}
+        )
+        if sqlite_tuned:
+            event.listen(sqlite_engine, "connect", _apply_sqlite_pragmas)
+        return sqlite_engine
 
-# Configure engine based on database type
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        DATABASE_URL, connect_args={"check_same_thread": False}
-    )
-else:
     # PostgreSQL configuration
-    engine = create_engine(
-        DATABASE_URL,
+    return create_engine(
+        url,
         pool_pre_ping=True,
         pool_recycle=300,
     )
 
+
+engine = create_db_engine(DATABASE_URL)
+replica_engines = [create_db_engine(url) for url in REPLICA_URLS]
+
+# Compiled SQL cache counters, fed by every statement this app's engines execute;
+# statements run on many threads at once, so updates and reads hold the lock
+_compile_cache_stats = {"hits": 0, "misses": 0}
+_compile_cache_lock = threading.Lock()
+
+
+def _count_compile_cache(conn, cursor, statement, parameters, context, executemany):
+    if context is None:
+        return
+    if context.cache_hit is default.CACHE_HIT:
+        counter = "hits"
+    elif context.cache_hit is default.CACHE_MISS:
+        counter = "misses"
+    else:
+        return
+    with _compile_cache_lock:
+        _compile_cache_stats[counter] += 1
+
+
+for _engine in (engine, *replica_engines):
+    event.listen(_engine, "after_cursor_execute", _count_compile_cache)
+
+
+def compile_cache_stats() -> dict:
+    """Compiled SQL cache hits and misses so far"""
+    with _compile_cache_lock:
+        return dict(_compile_cache_stats)
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReplicaSessions = [
+    sessionmaker(autocommit=False, autoflush=False, bind=replica)
+    for replica in replica_engines
+]
+_replica_counter = itertools.count()
+
+# Monotonic time of each client's last write, for read-your-writes routing; oldest write first
+_last_write_at: "OrderedDict[str, float]" = OrderedDict()
+_last_write_lock = threading.Lock()
 
 Base = declarative_base()
 
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
 
-def get_db():
-    db = SessionLocal()
+def client_address(request: Request) -> str:
+    """Peer address of the caller; behind a proxy, run uvicorn with --proxy-headers so this is the real client"""
+    return request.client.host if request.client else "unknown"
+
+
+def client_key(request: Request) -> str:
+    """Identify the caller for read-your-writes routing: an explicit X-Client-Id header, else the client address"""
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        return client_id
+    return client_address(request)
+
+
+def get_tenant(request: Request) -> str:
+    """Tenant the request acts on, from the X-Tenant-Id header"""
+    tenant_id = request.headers.get("x-tenant-id", "").strip()
+    if not tenant_id:
+        return DEFAULT_TENANT
+    if not _TENANT_PATTERN.match(tenant_id):
+        raise HTTPException(status_code=400, detail="Invalid X-Tenant-Id header")
+    return tenant_id
+
+
+def _record_write(request: Request):
+    # Writes are only remembered where a later read acts on them: by X-Client-Id, which opts a
+    # caller out of coalesced reads, and, with replicas, by address for read-your-writes routing
+    key = request.headers.get("x-client-id") or (client_address(request) if ReplicaSessions else None)
+    if key is None:
+        return
+    now = time.monotonic()
+    with _last_write_lock:
+        _last_write_at[key] = now
+        _last_write_at.move_to_end(key)
+        # Expired entries are always at the front, so pruning stops at the first live one
+        while _last_write_at:
+            oldest_key, written = next(iter(_last_write_at.items()))
+            if now - written < READ_YOUR_WRITES_SECONDS:
+                break
+            del _last_write_at[oldest_key]
+
+
+def _wrote_within_window(key: Optional[str]) -> bool:
+    if key is None:
+        return False
+    with _last_write_lock:
+        last_write = _last_write_at.get(key)
+    return last_write is not None and time.monotonic() - last_write < READ_YOUR_WRITES_SECONDS
+
+
+def wrote_recently(request: Request) -> bool:
+    """Whether the caller wrote within READ_YOUR_WRITES_SECONDS, so its reads must see the primary as of now"""
+    return _wrote_within_window(client_key(request))
+
+
+def shares_reads(request: Request) -> bool:
+    """Whether the caller may join a read already in flight for others: not if its X-Client-Id just wrote"""
+    # Keyed on X-Client-Id only, so one writer behind a shared address (NAT) can't turn coalescing off for all of it
+    return not _wrote_within_window(request.headers.get("x-client-id"))
+
+
+def _session_for(request: Request) -> Session:
+    if request.method not in READ_METHODS:
+        _record_write(request)
+        return SessionLocal()
+
+    if not ReplicaSessions or wrote_recently(request):
+        return SessionLocal()
+
+    return ReplicaSessions[next(_replica_counter) % len(ReplicaSessions)]()
+
+
+def _serializes_writes() -> bool:
+    return SQLITE_TUNED and engine.dialect.name == "sqlite"
+
+
+async def get_db(request: Request):
+    """Session on a replica for reads (round-robin), on the primary for writes"""
+    db = _session_for(request)
+    serialize = _serializes_writes() and request.method not in READ_METHODS
+    if serialize:
+        await sqlite_write_lock.acquire()
     try:
         yield db
     finally:
-        db.close()
+        await run_in_threadpool(db.close)
+        if serialize:
+            sqlite_write_lock.release()
+
+
+def sqlite_maintenance():
+    """Refresh planner statistics and fold the WAL back into the database file"""
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+async def run_sqlite_maintenance():
+    """Run sqlite_maintenance every SQLITE_MAINTENANCE_SECONDS, between write requests"""
+    while True:
+        await anyio.sleep(SQLITE_MAINTENANCE_SECONDS)
+        async with sqlite_write_lock:
+            await run_in_threadpool(sqlite_maintenance)
+
+
+def start_sqlite_maintenance() -> Optional[asyncio.Task]:
+    """Schedule maintenance on the running loop; keep the task, as the loop only holds it weakly"""
+    if not _serializes_writes():
+        return None
+    return asyncio.get_running_loop().create_task(run_sqlite_maintenance())
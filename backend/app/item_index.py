@@ -0,0 +1,261 @@
+"""
+Optional in-process read model for the items list.
+
+With ITEM_INDEX=1 each tenant's catalog is held in memory, loaded on the
+tenant's first request, as compact __slots__ records with dict-of-set indexes
+on type, status and location and a list of (updated_at, id) keys kept sorted
+for the default ordering. crud writes go through to it; comparing the
+tenant's change counter (see versions) with the one the index has caught up
+to, at most every ITEM_INDEX_CHECK_SECONDS, catches writes made by other
+processes and triggers a reload.
+"""
+
+import bisect
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from itertools import islice
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models, versions
+from .database import DEFAULT_TENANT, SessionLocal
+
+ENABLED = os.getenv("ITEM_INDEX", "0") == "1"
+CHECK_SECONDS = float(os.getenv("ITEM_INDEX_CHECK_SECONDS", "5"))
+
+FIELDS = (
+    "id", "name", "type", "location", "status", "quantity", "reserved",
+    "low_stock_threshold", "notes", "created_at", "updated_at",
+)
+
+_EMPTY: frozenset = frozenset()
+
+
+class ItemRecord:
+    """Read-only item row; serializes through ItemResponse like a models.Item"""
+    __slots__ = FIELDS
+
+    def __init__(self, *values):
+        for field, value in zip(FIELDS, values):
+            setattr(self, field, value)
+
+    @classmethod
+    def from_item(cls, item: models.Item) -> "ItemRecord":
+        return cls(*(getattr(item, field) for field in FIELDS))
+
+    @property
+    def sort_key(self) -> tuple:
+        return (self.updated_at, self.id)
+
+
+class ItemIndex:
+    def __init__(self, tenant_id: str = DEFAULT_TENANT):
+        self.tenant_id = tenant_id
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.version = 0
+        self.checked_at = 0.0
+        self.reloads = 0
+        self._reset()
+
+    def _reset(self):
+        self.records: dict[int, ItemRecord] = {}
+        self.by_type: dict[str, set[int]] = defaultdict(set)
+        self.by_status: dict[str, set[int]] = defaultdict(set)
+        self.by_location: dict[str, set[int]] = defaultdict(set)
+        # (updated_at, id) ascending; lists iterate newest-first from the end
+        self.order: list[tuple] = []
+
+    def _index(self, record: ItemRecord):
+        self.records[record.id] = record
+        self.by_type[record.type.value].add(record.id)
+        self.by_status[record.status.value].add(record.id)
+        if record.location:
+            self.by_location[record.location].add(record.id)
+
+    def _unindex(self, record: ItemRecord):
+        del self.records[record.id]
+        self.by_type[record.type.value].discard(record.id)
+        self.by_status[record.status.value].discard(record.id)
+        if record.location:
+            ids = self.by_location[record.location]
+            ids.discard(record.id)
+            if not ids:
+                del self.by_location[record.location]
+
+    def _live(self) -> tuple:
+        return (models.Item.tenant_id == self.tenant_id, models.Item.deleted_at.is_(None))
+
+    def load(self, db: Session):
+        # Version first: a write landing during the load then shows up as a newer version, not a missed one
+        version = versions.current(db, self.tenant_id)
+        columns = [getattr(models.Item, field) for field in FIELDS]
+        rows = db.execute(select(*columns).where(*self._live()).execution_options(yield_per=10_000))
+        with self.lock:
+            self.version = version
+            self._reset()
+            for row in rows:
+                self._index(ItemRecord(*row))
+            self.order = sorted(record.sort_key for record in self.records.values())
+            self.loaded = True
+            self.checked_at = time.monotonic()
+            self.reloads += 1
+
+    def advance(self, version: int):
+        """Catch up to a version written through from this process"""
+        with self.lock:
+            # Only the next version is ours alone; a gap means another process wrote in between
+            if version == self.version + 1:
+                self.version = version
+
+    def upsert(self, record: ItemRecord):
+        with self.lock:
+            self.discard(record.id)
+            self._index(record)
+            bisect.insort(self.order, record.sort_key)
+
+    def discard(self, item_id: int):
+        with self.lock:
+            record = self.records.get(item_id)
+            if record is None:
+                return
+            self._unindex(record)
+            position = bisect.bisect_left(self.order, record.sort_key)
+            if position < len(self.order) and self.order[position] == record.sort_key:
+                del self.order[position]
+
+    def _candidates(
+        self,
+        item_type: Optional[str],
+        status: Optional[str],
+        location: Optional[str],
+    ) -> Optional[set[int]]:
+        """Ids passing the indexed filters, or None when none are active"""
+        candidates: Optional[set[int]] = None
+        for index, key in ((self.by_type, item_type), (self.by_status, status)):
+            if key:
+                ids = index.get(key, _EMPTY)
+                candidates = ids if candidates is None else candidates & ids
+
+        if location:
+            needle = location.lower()
+            ids = set().union(*(ids for name, ids in self.by_location.items() if needle in name.lower()))
+            candidates = ids if candidates is None else candidates & ids
+
+        return candidates
+
+    @staticmethod
+    def _search(records: Iterable[ItemRecord], search: str) -> Iterable[ItemRecord]:
+        needle = search.lower()
+        return (
+            record for record in records
+            if needle in record.name.lower()
+            or (record.location and needle in record.location.lower())
+            or (record.notes and needle in record.notes.lower())
+        )
+
+    def query(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        search: Optional[str] = None,
+        item_type: Optional[str] = None,
+        status: Optional[str] = None,
+        location: Optional[str] = None,
+    ) -> list[ItemRecord]:
+        """Same filters and ordering as crud.get_items, answered from memory"""
+        with self.lock:
+            candidates = self._candidates(item_type, status, location)
+
+            want = skip + limit
+            if candidates is not None and _sort_is_cheaper(len(candidates), len(self.records), want):
+                ordered: Iterable[ItemRecord] = sorted(
+                    (self.records[item_id] for item_id in candidates),
+                    key=lambda record: record.sort_key,
+                    reverse=True,
+                )
+            else:
+                ordered = (self.records[key[1]] for key in reversed(self.order))
+                if candidates is not None:
+                    ordered = (record for record in ordered if record.id in candidates)
+
+            if search:
+                ordered = self._search(ordered, search)
+
+            return list(islice(ordered, skip, want))
+
+    def count(
+        self,
+        search: Optional[str] = None,
+        item_type: Optional[str] = None,
+        status: Optional[str] = None,
+        location: Optional[str] = None,
+    ) -> int:
+        """Exact number of items crud.get_items would page through"""
+        with self.lock:
+            candidates = self._candidates(item_type, status, location)
+            if not search:
+                return len(self.records) if candidates is None else len(candidates)
+            records = self.records.values() if candidates is None else (self.records[i] for i in candidates)
+            return sum(1 for _ in self._search(records, search))
+
+
+def _sort_is_cheaper(matches: int, total: int, want: int) -> bool:
+    """Sorting the matches vs walking the global order until `want` of them turn up"""
+    if matches == 0:
+        return True
+    return matches * math.log2(matches + 1) < want * total / matches
+
+
+_indexes: dict[str, ItemIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get(tenant_id: str = DEFAULT_TENANT) -> ItemIndex:
+    """The tenant's shared index, loaded on first use and reloaded if the database moved on"""
+    with _indexes_lock:
+        index = _indexes.get(tenant_id)
+        if index is None:
+            index = _indexes[tenant_id] = ItemIndex(tenant_id)
+
+    with index.lock:
+        if index.loaded and time.monotonic() - index.checked_at < CHECK_SECONDS:
+            return index
+        # Always the primary: the index is shared by every client, and a lagging replica
+        # would undo writes already applied through it
+        with SessionLocal() as db:
+            if not index.loaded or versions.current(db, tenant_id) != index.version:
+                index.load(db)
+            index.checked_at = time.monotonic()
+    return index
+
+
+def apply(item: models.Item, version: int):
+    """Write-through for a created or updated item, committed as `version`"""
+    index = _indexes.get(item.tenant_id)
+    if index is not None and index.loaded:
+        index.upsert(ItemRecord.from_item(item))
+        index.advance(version)
+
+
+def discard(item_id: int, tenant_id: str, version: int):
+    """Write-through for a soft-deleted item, committed as `version`"""
+    index = _indexes.get(tenant_id)
+    if index is not None and index.loaded:
+        index.discard(item_id)
+        index.advance(version)
+
+
+def stats() -> dict:
+    indexes = list(_indexes.values())
+    return {
+        "enabled": ENABLED,
+        "tenants": len(indexes),
+        "items": sum(len(index.records) for index in indexes),
+        "reloads": sum(index.reloads for index in indexes),
+    }
@@ -0,0 +1,268 @@
+"""
+Background runner for heavy reports.
+
+Jobs are rows in the jobs table. A small process pool executes them so large
+reports never tie up a request worker; the pool size bounds how many reports
+run at once, and further jobs wait in the queue. Handlers only see the items
+of the tenant that queued the job, passed to them as params["tenant_id"].
+
+Results are written straight to a file under JOB_RESULTS_DIR as the handler
+streams them, and the job row only keeps the file's path, so a large dump
+never sits in memory or in the database. A running job holds a lease: its worker (host:pid) renews heartbeat_at while
+the handler runs, and a job is only requeued once its lease has expired, so a
+starting server never takes over jobs still running in another live server.
+"""
+
+import csv
+import enum
+import json
+import multiprocessing
+import os
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, TextIO
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from . import models, purge
+
+# Upper bound on reports generated at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# A running job whose worker has not renewed its lease for this long is presumed lost
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Where finished reports are kept; must be storage every server shares when there are several
+JOB_RESULTS_DIR = os.getenv("JOB_RESULTS_DIR", "./job_results")
+
+ITEM_COLUMNS = [
+    "id", "name", "type", "location", "status", "quantity",
+    "low_stock_threshold", "notes", "created_at", "updated_at",
+]
+
+_executor: Optional[ProcessPoolExecutor] = None
+# Concurrent submits must not each build a pool of JOB_WORKERS processes
+_executor_lock = threading.Lock()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def inventory_dump(db: Session, params: dict, out: TextIO, report: Callable[[float], None]) -> str:
+    """Every item as CSV, optionally filtered by type and status"""
+    scope = (models.Item.tenant_id == params["tenant_id"], models.Item.deleted_at.is_(None))
+    query = select(*[getattr(models.Item, column) for column in ITEM_COLUMNS]).where(*scope).order_by(models.Item.id)
+    count_query = select(func.count(models.Item.id)).where(*scope)
+    for column in ("type", "status"):
+        if params.get(column):
+            condition = getattr(models.Item, column) == params[column]
+            query = query.where(condition)
+            count_query = count_query.where(condition)
+
+    total = db.scalar(count_query) or 1
+    writer = csv.writer(out)
+    writer.writerow(ITEM_COLUMNS)
+    for n, row in enumerate(db.execute(query.execution_options(yield_per=1000)), 1):
+        writer.writerow([_csv_value(value) for value in row])
+        if n % 1000 == 0:
+            report(n / total)
+    return "text/csv"
+
+
+def low_stock_report(db: Session, params: dict, out: TextIO, report: Callable[[float], None]) -> str:
+    """Parts at or below their low-stock threshold, grouped by location"""
+    query = (
+        select(
+            models.Item.location,
+            models.Item.name,
+            models.Item.quantity,
+            models.Item.low_stock_threshold,
+        )
+        .where(
+            models.Item.type == models.ItemType.part,
+            models.Item.quantity <= models.Item.low_stock_threshold,
+            models.Item.tenant_id == params["tenant_id"],
+            models.Item.deleted_at.is_(None),
+        )
+        .order_by(models.Item.location, models.Item.name)
+    )
+    writer = csv.writer(out)
+    writer.writerow(["location", "name", "quantity", "low_stock_threshold", "shortfall"])
+    for location, name, quantity, threshold in db.execute(query.execution_options(yield_per=1000)):
+        writer.writerow([_csv_value(location), name, quantity, threshold, threshold - quantity])
+    return "text/csv"
+
+
+def location_rollup(db: Session, params: dict, out: TextIO, report: Callable[[float], None]) -> str:
+    """Item counts per location and status"""
+    rows = db.execute(
+        select(models.Item.location, models.Item.status, func.count(models.Item.id))
+        .where(models.Item.tenant_id == params["tenant_id"], models.Item.deleted_at.is_(None))
+        .group_by(models.Item.location, models.Item.status)
+        .order_by(models.Item.location)
+    )
+    rollup: dict[str, dict[str, int]] = {}
+    for location, status, count in rows:
+        rollup.setdefault(location or "", {})[status.value] = count
+    json.dump(rollup, out)
+    return "application/json"
+
+
+def purge_deleted(db: Session, params: dict, out: TextIO, report: Callable[[float], None]) -> str:
+    """Permanently remove the tenant's soft-deleted items past the retention window"""
+    older_than_days = float(params.get("older_than_days", purge.RETENTION_DAYS))
+    purged = purge.purge_deleted(db, older_than_days=older_than_days, tenant_id=params["tenant_id"], report=report)
+    json.dump({"purged": purged}, out)
+    return "application/json"
+
+
+JOB_HANDLERS = {
+    models.JobKind.inventory_dump: inventory_dump,
+    models.JobKind.low_stock_report: low_stock_report,
+    models.JobKind.location_rollup: location_rollup,
+    models.JobKind.purge_deleted: purge_deleted,
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _set_progress(job_id: int, percent: int) -> None:
+    # Separate session so progress is visible while the report is still streaming
+    with SessionLocal() as db:
+        db.execute(update(models.Job).where(models.Job.id == job_id).values(progress=percent))
+        db.commit()
+
+
+def _renew_lease(job_id: int, worker: str, stop: threading.Event) -> None:
+    # Renew well inside the lease so one slow write does not let it lapse
+    while not stop.wait(JOB_LEASE_SECONDS / 3):
+        with SessionLocal() as db:
+            db.execute(
+                update(models.Job)
+                .where(models.Job.id == job_id, models.Job.worker == worker)
+                .values(heartbeat_at=_now())
+            )
+            db.commit()
+
+
+def run_job(job_id: int) -> None:
+    """Execute a queued job; runs inside a pool worker process"""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    with SessionLocal() as db:
+        # Claim the job atomically so a job resubmitted after a restart runs once
+        claimed = db.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id, models.Job.status == models.JobStatus.queued)
+            .values(status=models.JobStatus.running, started_at=_now(), worker=worker, heartbeat_at=_now())
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_renew_lease, args=(job_id, worker, stop), daemon=True)
+        heartbeat.start()
+        try:
+            _execute(db, job_id, worker)
+        finally:
+            stop.set()
+            heartbeat.join()
+
+
+def _execute(db: Session, job_id: int, worker: str) -> None:
+    """Run a claimed job's handler and record its outcome, unless the job was taken over meanwhile"""
+    job = db.get(models.Job, job_id)
+    last_percent = 0
+
+    def report(fraction: float) -> None:
+        nonlocal last_percent
+        percent = min(99, int(fraction * 100))
+        if percent > last_percent:
+            last_percent = percent
+            _set_progress(job_id, percent)
+
+    os.makedirs(JOB_RESULTS_DIR, exist_ok=True)
+    path = os.path.join(JOB_RESULTS_DIR, f"job-{job_id}")
+    # Written under a worker-specific name and renamed into place only if the job is still ours
+    partial = f"{path}.{os.getpid()}.part"
+    try:
+        # The tenant always comes from the job row, never from client-supplied params
+        params = {**json.loads(job.params or "{}"), "tenant_id": job.tenant_id}
+        with open(partial, "w", newline="", encoding="utf-8") as out:
+            result_type = JOB_HANDLERS[job.kind](db, params, out, report)
+    except Exception as e:
+        db.rollback()
+        outcome = {"status": models.JobStatus.failed, "error": str(e)[:500]}
+    else:
+        outcome = {
+            "status": models.JobStatus.succeeded,
+            "result_path": path,
+            "result_type": result_type,
+            "progress": 100,
+        }
+    finished = db.execute(
+        update(models.Job)
+        .where(models.Job.id == job_id, models.Job.worker == worker, models.Job.status == models.JobStatus.running)
+        .values(finished_at=_now(), **outcome)
+    ).rowcount
+    if finished and outcome["status"] == models.JobStatus.succeeded:
+        os.replace(partial, path)
+    db.commit()
+    if os.path.exists(partial):
+        os.remove(partial)
+
+
+def submit(job_id: int) -> None:
+    """Hand a queued job to the worker pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers build their own engine instead of inheriting pooled connections
+            _executor = ProcessPoolExecutor(
+                max_workers=JOB_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        _executor.submit(run_job, job_id)
+
+
+def resume_queued() -> int:
+    """Resubmit queued jobs, and running jobs whose worker's lease has expired"""
+    expired = _now() - timedelta(seconds=JOB_LEASE_SECONDS)
+    with SessionLocal() as db:
+        # Jobs with a live lease are still running in another server's pool; leave them be
+        db.execute(
+            update(models.Job)
+            .where(
+                models.Job.status == models.JobStatus.running,
+                or_(models.Job.heartbeat_at.is_(None), models.Job.heartbeat_at < expired),
+            )
+            .values(status=models.JobStatus.queued, progress=0, started_at=None, worker=None, heartbeat_at=None)
+        )
+        db.commit()
+        job_ids = db.execute(
+            select(models.Job.id)
+            .where(models.Job.status == models.JobStatus.queued)
+            .order_by(models.Job.id)
+        ).scalars().all()
+    for job_id in job_ids:
+        submit(job_id)
+    return len(job_ids)
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -1,13 +1,17 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+import math
+import os
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic_core import to_json
 from sqlalchemy.orm import Session
 from typing import Optional
+from datetime import datetime, timedelta, timezone
 
-from .database import engine, get_db, Base
-from . import crud, schemas
-
-# Create tables
-Base.metadata.create_all(bind=engine)
+from .compression import CompressionMiddleware
+from .database import client_address, engine, get_db, get_tenant, shares_reads, start_sqlite_maintenance
+from . import crud, item_index, jobs, migrations, schemas, stock, suggest, throttle
 
 app = FastAPI(
     title="IT Inventory Tracker",
@@ -15,6 +19,20 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Per-address rate limiting, since a client can pick any X-Client-Id; registered before CORS so 429s still carry CORS headers
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    if throttle.limiter.enabled and request.method != "OPTIONS":
+        retry_after = throttle.limiter.acquire(client_address(request))
+        if retry_after:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests"},
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+    return await call_next(request)
+
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -22,8 +40,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Total-Count-Estimated"],
 )
 
+# brotli/gzip for large bodies, such as item pages, on clients that accept it
+app.add_middleware(CompressionMiddleware)
+
+
+@app.on_event("startup")
+def check_schema():
+    # Migrations are a deploy step (python -m app.migrations), never run by each worker as it starts
+    gaps = migrations.missing(engine)
+    if gaps:
+        raise RuntimeError(f"Database schema is out of date (missing {', '.join(gaps)}); run python -m app.migrations")
+
+
+@app.on_event("startup")
+def start_jobs():
+    jobs.resume_queued()
+
+
+@app.on_event("startup")
+async def start_maintenance():
+    app.state.sqlite_maintenance = start_sqlite_maintenance()
+
+
+@app.on_event("shutdown")
+def stop_jobs():
+    jobs.shutdown()
+
 
 @app.get("/")
 def root():
@@ -32,58 +77,379 @@ def root():
 
 # Dashboard endpoint
 @app.get("/api/dashboard", response_model=schemas.DashboardStats)
-def get_dashboard(db: Session = Depends(get_db)):
-    return crud.get_dashboard_stats(db)
+def get_dashboard(request: Request, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    # Concurrent dashboard loads of the same tenant and database share one set of queries,
+    # except for a client (by X-Client-Id) that just wrote: a query already in flight may predate its commit
+    return throttle.coalesce(
+        ("dashboard", tenant_id, db.get_bind()),
+        lambda: crud.get_dashboard_stats(db, tenant_id),
+        share=shares_reads(request),
+    )
+
+
+# Default trend window when `from` is omitted
+TREND_WINDOWS = {
+    schemas.SnapshotBucket.hour: timedelta(hours=48),
+    schemas.SnapshotBucket.day: timedelta(days=30),
+}
+
+
+@app.get("/api/dashboard/trends", response_model=list[schemas.TrendPoint])
+def get_dashboard_trends(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: schemas.SnapshotBucket = schemas.SnapshotBucket.day,
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    """Counts by type, status and location over time, from precomputed snapshots"""
+    end = end or datetime.now(timezone.utc)
+    start = start or end - TREND_WINDOWS[bucket]
+    return crud.get_trends(db, start, end, bucket, tenant_id)
+
+
+# Rows serialized per chunk when streaming a JSON array
+STREAM_CHUNK_ROWS = 200
+
+
+def json_rows_response(rows: list[dict]) -> Response:
+    """Serialize already-typed rows without per-row model validation, streaming big pages"""
+    if len(rows) <= STREAM_CHUNK_ROWS:
+        return Response(content=to_json(rows), media_type="application/json")
+    
+    def chunks():
+        yield b"["
+        for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+            if start:
+                yield b","
+            yield to_json(rows[start:start + STREAM_CHUNK_ROWS])[1:-1]
+        yield b"]"
+    
+    return StreamingResponse(chunks(), media_type="application/json")
 
 
 # Items endpoints
 @app.get("/api/items", response_model=list[schemas.ItemResponse])
 def list_items(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     search: Optional[str] = None,
     type: Optional[str] = None,
     status: Optional[str] = None,
     location: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return; id is always included"),
     db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
 ):
-    return crud.get_items(
-        db, skip=skip, limit=limit, search=search,
-        item_type=type, status=status, location=location
+    projection = crud.item_fields([field.strip() for field in fields.split(",") if field.strip()] if fields else None)
+    if projection is None:
+        raise HTTPException(status_code=400, detail=f"fields must be from: {', '.join(crud.ITEM_FIELDS)}")
+    
+    filters = {"search": search, "item_type": type, "status": status, "location": location, "tenant_id": tenant_id}
+    key = (db.get_bind(), *filters.values())
+    # A client that just wrote must not join a query that may have started before its commit
+    share = shares_reads(request)
+    
+    # Identical concurrent list requests share one query
+    items = throttle.coalesce(
+        ("items", skip, limit, projection, *key),
+        lambda: crud.get_items(db, skip=skip, limit=limit, fields=projection, **filters),
+        share=share,
     )
+    response = json_rows_response(items)
+    
+    if with_total:
+        total, estimated = throttle.coalesce(
+            ("items_total", *key),
+            lambda: crud.count_items(db, **filters),
+            share=share,
+        )
+        response.headers["X-Total-Count"] = str(total)
+        response.headers["X-Total-Count-Estimated"] = "true" if estimated else "false"
+    
+    return response
 
 
 @app.get("/api/items/{item_id}", response_model=schemas.ItemResponse)
-def get_item(item_id: int, db: Session = Depends(get_db)):
-    item = crud.get_item(db, item_id)
+def get_item(item_id: int, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    item = crud.get_item(db, item_id, tenant_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     return item
 
 
 @app.post("/api/items", response_model=schemas.ItemResponse, status_code=201)
-def create_item(item: schemas.ItemCreate, db: Session = Depends(get_db)):
-    return crud.create_item(db, item)
+def create_item(item: schemas.ItemCreate, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    if item.quantity < 0:
+        raise HTTPException(status_code=400, detail="quantity cannot be negative")
+    return crud.create_item(db, item, tenant_id)
 
 
 @app.put("/api/items/{item_id}", response_model=schemas.ItemResponse)
-def update_item(item_id: int, item: schemas.ItemUpdate, db: Session = Depends(get_db)):
-    updated = crud.update_item(db, item_id, item)
+def update_item(
+    item_id: int,
+    item: schemas.ItemUpdate,
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    if item.quantity is not None and item.quantity < 0:
+        raise HTTPException(status_code=400, detail="quantity cannot be negative")
+    updated = crud.update_item(db, item_id, item, tenant_id)
     if not updated:
+        if crud.get_item(db, item_id, tenant_id):
+            raise HTTPException(status_code=409, detail="Use checkout and checkin to change a checked-out status")
         raise HTTPException(status_code=404, detail="Item not found")
     return updated
 
 
 @app.delete("/api/items/{item_id}")
-def delete_item(item_id: int, db: Session = Depends(get_db)):
-    deleted = crud.delete_item(db, item_id)
+def delete_item(item_id: int, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    deleted = crud.delete_item(db, item_id, tenant_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Item not found")
     return {"message": "Item deleted successfully"}
 
 
+@app.post("/api/items/{item_id}/restore", response_model=schemas.ItemResponse)
+def restore_item(item_id: int, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    """Undo a delete that has not been purged yet"""
+    restored = crud.restore_item(db, item_id, tenant_id)
+    if not restored:
+        raise HTTPException(status_code=404, detail="Deleted item not found")
+    return restored
+
+
 # Utility endpoints
+@app.get("/api/suggest", response_model=list[str])
+def get_suggestions(
+    q: str = Query(..., min_length=1, max_length=100),
+    field: schemas.SuggestField = schemas.SuggestField.name,
+    limit: int = Query(8, ge=1, le=25),
+    tenant_id: str = Depends(get_tenant),
+):
+    """Typeahead matches for item names or locations"""
+    return suggest.suggest(field.value, q, limit, tenant_id)
+
+
 @app.get("/api/locations", response_model=list[str])
-def get_locations(db: Session = Depends(get_db)):
+def get_locations(db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
     """Get all unique locations for filter dropdown"""
-    return crud.get_unique_locations(db)
+    return crud.get_unique_locations(db, tenant_id)
+
+
+@app.get("/api/locations/summary", response_model=list[schemas.LocationResponse])
+def get_location_summaries(db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    """Locations with building/room breakdown and item counts"""
+    return crud.get_location_summaries(db, tenant_id)
+
+
+# Check-in / check-out
+@app.post("/api/items/{item_id}/checkout", response_model=schemas.CheckoutResponse, status_code=201)
+def checkout_item(
+    item_id: int,
+    checkout: schemas.CheckoutCreate,
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    item = crud.get_item(db, item_id, tenant_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    db_checkout = crud.checkout_item(db, item, checkout)
+    if not db_checkout:
+        raise HTTPException(status_code=409, detail="Item is already checked out")
+    return db_checkout
+
+
+@app.post("/api/items/{item_id}/checkin", response_model=schemas.CheckoutResponse)
+def checkin_item(item_id: int, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    item = crud.get_item(db, item_id, tenant_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    db_checkout = crud.checkin_item(db, item)
+    if not db_checkout:
+        raise HTTPException(status_code=409, detail="Item is not checked out")
+    return db_checkout
+
+
+@app.get("/api/checkouts", response_model=list[schemas.CheckoutResponse])
+def list_checkouts(
+    assignee: Optional[str] = None,
+    open: bool = False,
+    overdue: bool = False,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    """Checkouts, optionally only open or overdue ones for an assignee"""
+    return crud.get_checkouts(
+        db, assignee=assignee, open_only=open, overdue=overdue, skip=skip, limit=limit, tenant_id=tenant_id
+    )
+
+
+# Spare-part stock ledger and reservations
+def get_part(db: Session, item_id: int, tenant_id: str):
+    item = crud.get_item(db, item_id, tenant_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if item.type != schemas.ItemType.part:
+        raise HTTPException(status_code=400, detail="Stock is only tracked for spare parts")
+    return item
+
+
+@app.post("/api/items/{item_id}/movements", response_model=schemas.MovementResponse, status_code=201)
+def create_movement(
+    item_id: int,
+    movement: schemas.MovementCreate,
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    """Receive or consume units of a part, or adjust its count by a signed amount"""
+    if movement.quantity == 0 or (movement.kind != schemas.MovementKind.adjust and movement.quantity < 0):
+        raise HTTPException(status_code=400, detail="quantity must be positive (non-zero for adjust)")
+    item = get_part(db, item_id, tenant_id)
+    db_movement = stock.move(db, item, movement.kind, movement.quantity, movement.notes)
+    if not db_movement:
+        raise HTTPException(status_code=409, detail="Not enough unreserved stock")
+    return db_movement
+
+
+@app.get("/api/items/{item_id}/movements", response_model=list[schemas.MovementResponse])
+def list_movements(
+    item_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    """A part's stock ledger, newest first"""
+    return stock.get_movements(db, get_part(db, item_id, tenant_id), skip=skip, limit=limit)
+
+
+@app.get("/api/items/{item_id}/consumption", response_model=list[schemas.DailyConsumption])
+def get_consumption(
+    item_id: int,
+    days: int = Query(stock.FORECAST_DAYS, ge=1, le=366),
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    """Units received and consumed per day, from the daily totals"""
+    return stock.get_daily_consumption(db, get_part(db, item_id, tenant_id), days)
+
+
+@app.get("/api/stock/forecast", response_model=list[schemas.StockForecast])
+def get_stock_forecast(
+    days: int = Query(stock.FORECAST_DAYS, ge=1, le=366),
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    """Consumption rate of every part and when it will reach its low-stock threshold, soonest first"""
+    return stock.forecast(db, days, tenant_id)
+
+
+@app.post("/api/items/{item_id}/reservations", response_model=schemas.ReservationResponse, status_code=201)
+def create_reservation(
+    item_id: int,
+    reservation: schemas.ReservationCreate,
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    """Hold units of a part for a pending repair"""
+    if reservation.quantity <= 0:
+        raise HTTPException(status_code=400, detail="quantity must be positive")
+    item = get_part(db, item_id, tenant_id)
+    db_reservation = stock.reserve(db, item, reservation.quantity, reservation.holder, reservation.notes)
+    if not db_reservation:
+        raise HTTPException(status_code=409, detail="Not enough unreserved stock")
+    return db_reservation
+
+
+@app.get("/api/reservations", response_model=list[schemas.ReservationResponse])
+def list_reservations(
+    item_id: Optional[int] = None,
+    open: bool = False,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_tenant),
+):
+    return stock.get_reservations(db, item_id=item_id, open_only=open, skip=skip, limit=limit, tenant_id=tenant_id)
+
+
+@app.post("/api/reservations/{reservation_id}/fulfill", response_model=schemas.ReservationResponse)
+def fulfill_reservation(reservation_id: int, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    """Use the held units: records a consume movement"""
+    reservation = stock.get_reservation(db, reservation_id, tenant_id)
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    fulfilled = stock.fulfill(db, reservation)
+    if not fulfilled:
+        if reservation.status != schemas.ReservationStatus.open:
+            detail = "Reservation is not open"
+        elif reservation.item.deleted_at is not None:
+            detail = "Part has been deleted; restore it or release the reservation"
+        else:
+            detail = "Part has fewer units than the reservation"
+        raise HTTPException(status_code=409, detail=detail)
+    return fulfilled
+
+
+@app.post("/api/reservations/{reservation_id}/release", response_model=schemas.ReservationResponse)
+def release_reservation(reservation_id: int, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    """Give the held units back without using them"""
+    reservation = stock.get_reservation(db, reservation_id, tenant_id)
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    released = stock.release(db, reservation)
+    if not released:
+        raise HTTPException(status_code=409, detail="Reservation is not open")
+    return released
+
+
+# Background report jobs
+@app.post("/api/jobs", response_model=schemas.JobResponse, status_code=202)
+def create_job(job: schemas.JobCreate, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    db_job = crud.create_job(db, job, tenant_id)
+    jobs.submit(db_job.id)
+    return db_job
+
+
+@app.get("/api/jobs/{job_id}", response_model=schemas.JobResponse)
+def get_job(job_id: int, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    job = crud.get_job(db, job_id, tenant_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: int, db: Session = Depends(get_db), tenant_id: str = Depends(get_tenant)):
+    job = crud.get_job(db, job_id, tenant_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != schemas.JobStatus.succeeded:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status.value}")
+    
+    extension = "csv" if job.result_type == "text/csv" else "json"
+    filename = f"{job.kind.value}-{job.id}.{extension}"
+    if job.result_path is None:
+        return Response(
+            content=job.result,
+            media_type=job.result_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+    if not os.path.exists(job.result_path):
+        raise HTTPException(status_code=410, detail="Job result is no longer available")
+    return FileResponse(job.result_path, media_type=job.result_type, filename=filename)
+
+
+@app.get("/api/metrics")
+def get_metrics():
+    """Cache and throughput counters for monitoring"""
+    return {
+        "statement_cache": crud.get_statement_cache_stats(),
+        "item_index": item_index.stats(),
+        **throttle.stats(),
+    }
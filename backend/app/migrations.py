@@ -0,0 +1,234 @@
+"""
+Schema upgrades for databases created before the current models.
+Base.metadata.create_all only adds missing tables, so new columns on existing
+tables and their backfills live here. Every step is safe to re-run.
+Run from the backend directory, once per deploy before the servers start:
+python -m app.migrations
+"""
+
+from sqlalchemy import func, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .database import engine, Base, DEFAULT_TENANT
+from . import crud, models
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(col["name"] == column for col in inspect(conn).get_columns(table))
+
+
+def add_items_location_id(conn: Connection):
+    """Reference the locations table from items"""
+    if _has_column(conn, "items", "location_id"):
+        return
+    conn.execute(text("ALTER TABLE items ADD COLUMN location_id INTEGER REFERENCES locations(id)"))
+    conn.execute(text("CREATE INDEX ix_items_location_id ON items (location_id)"))
+
+
+def add_items_deleted_at(conn: Connection):
+    """Soft delete tombstones; the partial indexes over live rows come from create_indexes"""
+    if _has_column(conn, "items", "deleted_at"):
+        return
+    conn.execute(text("ALTER TABLE items ADD COLUMN deleted_at TIMESTAMP WITH TIME ZONE"))
+
+
+def add_tenant_ids(conn: Connection):
+    """Scope items, locations and jobs to a tenant; existing rows join the default tenant"""
+    for table in ("items", "locations", "jobs"):
+        if not _has_column(conn, table, "tenant_id"):
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN tenant_id VARCHAR(50) NOT NULL DEFAULT '{DEFAULT_TENANT}'"
+            ))
+
+    # Superseded by the tenant-leading indexes; location keys are now unique per tenant
+    for index in ("ix_items_live_updated_at", "ix_items_live_type_status", "ix_locations_key"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE locations DROP CONSTRAINT IF EXISTS locations_key_key"))
+
+
+def add_checkouts_tenant_id(conn: Connection):
+    """Scope checkouts to their item's tenant; the tenant-leading indexes come from create_indexes"""
+    if not _has_column(conn, "checkouts", "tenant_id"):
+        conn.execute(text(
+            f"ALTER TABLE checkouts ADD COLUMN tenant_id VARCHAR(50) NOT NULL DEFAULT '{DEFAULT_TENANT}'"
+        ))
+        conn.execute(text(
+            "UPDATE checkouts SET tenant_id = (SELECT items.tenant_id FROM items WHERE items.id = checkouts.item_id)"
+        ))
+
+    for index in ("ix_checkouts_assignee", "ix_checkouts_open_due"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+
+def add_stats_snapshots_tenant_id(conn: Connection):
+    """Key trend snapshots by tenant, widening their unique constraint"""
+    if _has_column(conn, "stats_snapshots", "tenant_id"):
+        return
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            f"ALTER TABLE stats_snapshots ADD COLUMN tenant_id VARCHAR(50) NOT NULL DEFAULT '{DEFAULT_TENANT}'"
+        ))
+        conn.execute(text(
+            "ALTER TABLE stats_snapshots DROP CONSTRAINT IF EXISTS stats_snapshots_bucket_bucket_start_dimension_value_key"
+        ))
+        conn.execute(text("DROP INDEX IF EXISTS ix_stats_snapshots_bucket_start"))
+        conn.execute(text(
+            "ALTER TABLE stats_snapshots ADD UNIQUE (tenant_id, bucket, bucket_start, dimension, value)"
+        ))
+        return
+
+    # SQLite cannot alter a table's constraints, so rebuild the table around the rows
+    conn.execute(text("ALTER TABLE stats_snapshots RENAME TO stats_snapshots_old"))
+    models.StatsSnapshot.__table__.create(conn)
+    conn.execute(text(
+        "INSERT INTO stats_snapshots (tenant_id, bucket, bucket_start, dimension, value, count) "
+        f"SELECT '{DEFAULT_TENANT}', bucket, bucket_start, dimension, value, count FROM stats_snapshots_old"
+    ))
+    conn.execute(text("DROP TABLE stats_snapshots_old"))
+
+
+def add_job_kinds(conn: Connection):
+    """Postgres enums are types of their own; new JobKind values must be added to them"""
+    if conn.dialect.name != "postgresql":
+        return
+    for kind in models.JobKind:
+        conn.execute(text(f"ALTER TYPE jobkind ADD VALUE IF NOT EXISTS '{kind.name}'"))
+
+
+def add_jobs_lease(conn: Connection):
+    """Owner and heartbeat of a running job, so restarts only requeue jobs whose lease expired"""
+    if _has_column(conn, "jobs", "worker"):
+        return
+    conn.execute(text("ALTER TABLE jobs ADD COLUMN worker VARCHAR(100)"))
+    conn.execute(text("ALTER TABLE jobs ADD COLUMN heartbeat_at TIMESTAMP WITH TIME ZONE"))
+
+
+def add_jobs_result_path(conn: Connection):
+    """Finished reports are files; the job row keeps their path"""
+    if _has_column(conn, "jobs", "result_path"):
+        return
+    conn.execute(text("ALTER TABLE jobs ADD COLUMN result_path VARCHAR(500)"))
+
+
+def add_items_reserved(conn: Connection):
+    """Units held by open stock reservations"""
+    if _has_column(conn, "items", "reserved"):
+        return
+    conn.execute(text("ALTER TABLE items ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0"))
+
+
+def open_stock_ledgers(conn: Connection):
+    """Give parts that predate the ledger an opening movement, so quantity equals the sum of movements"""
+    Item, StockMovement = models.Item, models.StockMovement
+    unledgered = conn.execute(
+        select(Item.tenant_id, Item.id, Item.quantity)
+        .where(
+            Item.type == models.ItemType.part,
+            Item.quantity != 0,
+            ~select(StockMovement.id).where(StockMovement.item_id == Item.id).exists(),
+        )
+    ).all()
+    if unledgered:
+        conn.execute(insert(StockMovement), [
+            {
+                "tenant_id": tenant_id,
+                "item_id": item_id,
+                "kind": models.MovementKind.adjust,
+                "quantity": quantity,
+                "balance": quantity,
+                "notes": "Opening balance",
+            }
+            for tenant_id, item_id, quantity in unledgered
+        ])
+
+
+def open_legacy_checkouts(conn: Connection):
+    """Give items marked checked out before checkouts were recorded an open checkout, so checkin can close them"""
+    Item, Checkout = models.Item, models.Checkout
+    unrecorded = conn.execute(
+        select(Item.tenant_id, Item.id, func.coalesce(Item.updated_at, Item.created_at))
+        .where(
+            Item.status == models.ItemStatus.checked_out,
+            ~select(Checkout.id).where(Checkout.item_id == Item.id, Checkout.returned_at.is_(None)).exists(),
+        )
+    ).all()
+    if unrecorded:
+        conn.execute(insert(Checkout), [
+            {
+                "tenant_id": tenant_id,
+                "item_id": item_id,
+                "assignee": "Unknown",
+                "out_at": out_at,
+                "notes": "Checked out before checkouts were recorded",
+            }
+            for tenant_id, item_id, out_at in unrecorded
+        ])
+
+
+def add_items_name_trigram_index(conn: Connection):
+    """Index live item names for the serverless typeahead's word-start ILIKE patterns (Postgres only)"""
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_items_live_name_trgm ON items USING gin (name gin_trgm_ops) "
+        "WHERE deleted_at IS NULL"
+    ))
+
+
+def create_indexes(conn: Connection):
+    """Indexes added to the models after their tables were created"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    add_items_location_id,
+    add_items_deleted_at,
+    add_tenant_ids,
+    add_checkouts_tenant_id,
+    add_stats_snapshots_tenant_id,
+    add_job_kinds,
+    add_jobs_lease,
+    add_jobs_result_path,
+    add_items_reserved,
+    open_stock_ledgers,
+    open_legacy_checkouts,
+    add_items_name_trigram_index,
+    create_indexes,
+]
+
+
+def missing(bind: Engine = engine) -> list[str]:
+    """Tables and columns of the models the database lacks; empty once upgrade has run"""
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    gaps = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            gaps.append(table.name)
+            continue
+        columns = {col["name"] for col in inspector.get_columns(table.name)}
+        gaps.extend(f"{table.name}.{column.name}" for column in table.columns if column.name not in columns)
+    return gaps
+
+
+def upgrade(bind: Engine = engine):
+    """Create missing tables, apply column migrations and backfill derived data"""
+    Base.metadata.create_all(bind=bind)
+
+    with bind.begin() as conn:
+        for migration in MIGRATIONS:
+            migration(conn)
+
+    with Session(bind=bind) as db:
+        linked = crud.sync_locations(db)
+    return linked
+
+
+if __name__ == "__main__":
+    linked = upgrade()
+    print(f"[OK] Database schema is up to date ({linked} location names normalized)")
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Enum, ForeignKey, Index, UniqueConstraint, text
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
 
-from .database import Base
+from .database import Base, DEFAULT_TENANT
 
 
 class ItemType(str, enum.Enum):
@@ -17,16 +18,235 @@ class ItemStatus(str, enum.Enum):
     checked_out = "checked_out"
 
 
+class JobKind(str, enum.Enum):
+    inventory_dump = "inventory_dump"
+    low_stock_report = "low_stock_report"
+    location_rollup = "location_rollup"
+    purge_deleted = "purge_deleted"
+
+
+class JobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class SnapshotBucket(str, enum.Enum):
+    hour = "hour"
+    day = "day"
+
+
+class MovementKind(str, enum.Enum):
+    receive = "receive"
+    consume = "consume"
+    adjust = "adjust"
+
+
+class ReservationStatus(str, enum.Enum):
+    open = "open"
+    fulfilled = "fulfilled"
+    released = "released"
+
+
+class Location(Base):
+    __tablename__ = "locations"
+    __table_args__ = (
+        # Every school can have its own "Room 205"
+        Index("ux_locations_tenant_key", "tenant_id", "key", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+    name = Column(String(100), nullable=False)
+    # Case/whitespace-folded name, so "room 205 " and "Room 205" share a row
+    key = Column(String(100), nullable=False)
+    building = Column(String(100), nullable=True)
+    room = Column(String(50), nullable=True)
+    item_count = Column(Integer, nullable=False, default=0)
+
+
 class Item(Base):
     __tablename__ = "items"
+    __table_args__ = (
+        # Reads only ever see one tenant's live rows, so their indexes lead with
+        # tenant_id and leave tombstones out
+        Index(
+            "ix_items_tenant_live_updated_at", "tenant_id", "updated_at",
+            postgresql_where=text("deleted_at IS NULL"),
+            sqlite_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_items_tenant_live_type_status", "tenant_id", "type", "status",
+            postgresql_where=text("deleted_at IS NULL"),
+            sqlite_where=text("deleted_at IS NULL"),
+        ),
+        # The purge job scans only tombstones
+        Index(
+            "ix_items_deleted_at", "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+            sqlite_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
     name = Column(String(100), nullable=False, index=True)
     type = Column(Enum(ItemType), nullable=False, default=ItemType.device)
+    # Display name of the location, kept alongside location_id for the string API
     location = Column(String(100), nullable=True)
+    location_id = Column(Integer, ForeignKey("locations.id"), nullable=True, index=True)
     status = Column(Enum(ItemStatus), nullable=False, default=ItemStatus.available)
+    # For parts, the balance of the stock_movements ledger; only stock.py changes it
     quantity = Column(Integer, default=1)
+    # Units held by open reservations; quantity - reserved is what can be taken
+    reserved = Column(Integer, nullable=False, default=0, server_default="0")
     low_stock_threshold = Column(Integer, default=5)
     notes = Column(String(500), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Set when the item is deleted; the row stays until the purge job removes it
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class ItemVersion(Base):
+    """Per-tenant change counter, bumped by every transaction that changes the tenant's items"""
+    __tablename__ = "item_versions"
+
+    tenant_id = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+    kind = Column(Enum(JobKind), nullable=False)
+    params = Column(Text, nullable=True)  # JSON encoded
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.queued, index=True)
+    progress = Column(Integer, nullable=False, default=0)  # percent
+    result = Column(Text, nullable=True)  # inline result of jobs finished before results moved to files
+    result_path = Column(String(500), nullable=True)
+    result_type = Column(String(50), nullable=True)
+    error = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    # Lease of the pool worker (host:pid) running the job, renewed while it runs
+    worker = Column(String(100), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class StatsSnapshot(Base):
+    """A tenant's item count for one dimension value (e.g. status=broken) in one time bucket"""
+    __tablename__ = "stats_snapshots"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "bucket", "bucket_start", "dimension", "value"),
+        Index("ix_stats_snapshots_tenant_bucket_start", "tenant_id", "bucket", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+    bucket = Column(Enum(SnapshotBucket), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    dimension = Column(String(20), nullable=False)  # "type", "status" or "location"
+    value = Column(String(100), nullable=False)
+    count = Column(Integer, nullable=False)
+
+
+class Checkout(Base):
+    __tablename__ = "checkouts"
+    __table_args__ = (
+        # At most one open checkout per item
+        Index(
+            "ux_checkouts_open_item", "item_id", unique=True,
+            postgresql_where=text("returned_at IS NULL"),
+            sqlite_where=text("returned_at IS NULL"),
+        ),
+        # Overdue lookups only ever scan one tenant's open checkouts
+        Index(
+            "ix_checkouts_tenant_open_due", "tenant_id", "due_at",
+            postgresql_where=text("returned_at IS NULL"),
+            sqlite_where=text("returned_at IS NULL"),
+        ),
+        Index("ix_checkouts_tenant_assignee", "tenant_id", "assignee"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=False, index=True)
+    assignee = Column(String(100), nullable=False)
+    out_at = Column(DateTime(timezone=True), server_default=func.now())
+    due_at = Column(DateTime(timezone=True), nullable=True)
+    returned_at = Column(DateTime(timezone=True), nullable=True)
+    notes = Column(String(500), nullable=True)
+
+    item = relationship("Item")
+
+    @property
+    def item_name(self) -> str:
+        return self.item.name
+
+
+class StockMovement(Base):
+    """One change to a part's stock; an item's quantity is the sum of its movements"""
+    __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("ix_stock_movements_item_created_at", "item_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(Enum(MovementKind), nullable=False)
+    quantity = Column(Integer, nullable=False)  # signed change
+    balance = Column(Integer, nullable=False)  # item quantity after this movement
+    reservation_id = Column(Integer, ForeignKey("stock_reservations.id", ondelete="SET NULL"), nullable=True)
+    notes = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class StockReservation(Base):
+    """Stock held for a pending repair until it is used (fulfilled) or given back (released)"""
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        Index("ix_stock_reservations_item_id", "item_id"),
+        Index(
+            "ix_stock_reservations_tenant_open", "tenant_id", "created_at",
+            postgresql_where=text("status = 'open'"),
+            sqlite_where=text("status = 'open'"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    holder = Column(String(100), nullable=False)  # repair ticket or technician
+    notes = Column(String(500), nullable=True)
+    status = Column(Enum(ReservationStatus), nullable=False, default=ReservationStatus.open)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    closed_at = Column(DateTime(timezone=True), nullable=True)
+
+    item = relationship("Item")
+
+    @property
+    def item_name(self) -> str:
+        return self.item.name
+
+
+class StockDailyTotal(Base):
+    """Units of a part received and consumed on one UTC day, kept up to date by each movement"""
+    __tablename__ = "stock_daily_totals"
+    __table_args__ = (
+        UniqueConstraint("item_id", "day"),
+        Index("ix_stock_daily_totals_tenant_day", "tenant_id", "day"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+    received = Column(Integer, nullable=False, default=0)
+    consumed = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,101 @@
+"""
+Permanent removal of soft-deleted items.
+Tombstones older than SOFT_DELETE_RETENTION_DAYS are deleted along with their
+checkouts and stock history, PURGE_BATCH_SIZE items per transaction so no
+single statement holds locks for long. Also runs as the purge_deleted
+background job.
+Run from the backend directory: python -m app.purge [--interval SECONDS]
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Checkout, Item, StockDailyTotal, StockMovement, StockReservation
+
+# Deleted items can be restored for this long before they are purged
+RETENTION_DAYS = float(os.getenv("SOFT_DELETE_RETENTION_DAYS", "30"))
+BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+
+
+def _expired(cutoff: datetime, tenant_id: Optional[str]) -> list:
+    conditions = [Item.deleted_at < cutoff]
+    if tenant_id is not None:
+        conditions.append(Item.tenant_id == tenant_id)
+    return conditions
+
+
+def purge_batch(
+    db: Session,
+    cutoff: datetime,
+    batch_size: int = BATCH_SIZE,
+    tenant_id: Optional[str] = None,
+) -> int:
+    """Delete up to batch_size items tombstoned before cutoff; returns how many went"""
+    # Served by the partial index over tombstones
+    expired = (
+        select(Item.id)
+        .where(*_expired(cutoff, tenant_id))
+        .order_by(Item.deleted_at)
+        .limit(batch_size)
+    )
+    ids = db.execute(expired).scalars().all()
+    if not ids:
+        return 0
+
+    # Re-check deleted_at so an item restored meanwhile is left alone
+    still_expired = select(Item.id).where(Item.id.in_(ids), Item.deleted_at < cutoff)
+    # Movements first: they reference reservations
+    for history in (Checkout, StockMovement, StockReservation, StockDailyTotal):
+        db.execute(delete(history).where(history.item_id.in_(still_expired)))
+    purged = db.execute(delete(Item).where(Item.id.in_(ids), Item.deleted_at < cutoff)).rowcount
+    db.commit()
+    return purged
+
+
+def purge_deleted(
+    db: Session,
+    older_than_days: float = RETENTION_DAYS,
+    batch_size: int = BATCH_SIZE,
+    tenant_id: Optional[str] = None,
+    report: Optional[Callable[[float], None]] = None,
+) -> int:
+    """Purge tombstones older than the retention window (of one tenant, or all), one batch at a time"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    total = db.scalar(select(func.count(Item.id)).where(*_expired(cutoff, tenant_id))) or 1
+
+    purged = 0
+    while True:
+        batch = purge_batch(db, cutoff, batch_size, tenant_id)
+        if not batch:
+            break
+        purged += batch
+        if report:
+            report(purged / total)
+    return purged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Permanently remove old soft-deleted items")
+    parser.add_argument("--days", type=float, default=RETENTION_DAYS, help="keep tombstones this many days")
+    parser.add_argument("--tenant", help="only purge this tenant's items (default: all tenants)")
+    parser.add_argument("--interval", type=int, default=0, help="keep running, purging every N seconds")
+    args = parser.parse_args()
+
+    while True:
+        with SessionLocal() as db:
+            purged = purge_deleted(db, older_than_days=args.days, tenant_id=args.tenant)
+        print(f"[OK] Purged {purged} deleted items at {datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S} UTC")
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
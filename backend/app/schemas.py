@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 
 
@@ -16,6 +16,42 @@ class ItemStatus(str, Enum):
     checked_out = "checked_out"
 
 
+class JobKind(str, Enum):
+    inventory_dump = "inventory_dump"
+    low_stock_report = "low_stock_report"
+    location_rollup = "location_rollup"
+    purge_deleted = "purge_deleted"
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class SnapshotBucket(str, Enum):
+    hour = "hour"
+    day = "day"
+
+
+class MovementKind(str, Enum):
+    receive = "receive"
+    consume = "consume"
+    adjust = "adjust"
+
+
+class ReservationStatus(str, Enum):
+    open = "open"
+    fulfilled = "fulfilled"
+    released = "released"
+
+
+class SuggestField(str, Enum):
+    name = "name"
+    location = "location"
+
+
 class ItemBase(BaseModel):
     name: str
     type: ItemType = ItemType.device
@@ -42,6 +78,7 @@ class ItemUpdate(BaseModel):
 
 class ItemResponse(ItemBase):
     id: int
+    reserved: int = 0
     created_at: datetime
     updated_at: datetime
 
@@ -49,6 +86,17 @@ class ItemResponse(ItemBase):
         from_attributes = True
 
 
+class LocationResponse(BaseModel):
+    id: int
+    name: str
+    building: Optional[str] = None
+    room: Optional[str] = None
+    item_count: int
+
+    class Config:
+        from_attributes = True
+
+
 class DashboardStats(BaseModel):
     total_items: int
     total_devices: int
@@ -58,3 +106,110 @@ class DashboardStats(BaseModel):
     broken_count: int
     checked_out_count: int
     low_stock_items: list[ItemResponse]
+
+
+class CheckoutCreate(BaseModel):
+    assignee: str
+    due_at: Optional[datetime] = None
+    notes: Optional[str] = None
+
+
+class CheckoutResponse(BaseModel):
+    id: int
+    item_id: int
+    item_name: str
+    assignee: str
+    out_at: datetime
+    due_at: Optional[datetime] = None
+    returned_at: Optional[datetime] = None
+    notes: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class TrendPoint(BaseModel):
+    bucket_start: datetime
+    type: dict[str, int] = {}
+    status: dict[str, int] = {}
+    location: dict[str, int] = {}
+
+
+class JobCreate(BaseModel):
+    kind: JobKind
+    params: dict = {}
+
+
+class JobResponse(BaseModel):
+    id: int
+    kind: JobKind
+    status: JobStatus
+    progress: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class MovementCreate(BaseModel):
+    kind: MovementKind
+    # Units received or consumed; for adjust, the signed correction
+    quantity: int
+    notes: Optional[str] = None
+
+
+class MovementResponse(BaseModel):
+    id: int
+    item_id: int
+    kind: MovementKind
+    quantity: int
+    balance: int
+    reservation_id: Optional[int] = None
+    notes: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ReservationCreate(BaseModel):
+    quantity: int
+    holder: str
+    notes: Optional[str] = None
+
+
+class ReservationResponse(BaseModel):
+    id: int
+    item_id: int
+    item_name: str
+    quantity: int
+    holder: str
+    notes: Optional[str] = None
+    status: ReservationStatus
+    created_at: datetime
+    closed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class DailyConsumption(BaseModel):
+    day: date
+    received: int
+    consumed: int
+
+
+class StockForecast(BaseModel):
+    item_id: int
+    name: str
+    quantity: int
+    reserved: int
+    low_stock_threshold: int
+    consumed: int  # over the window
+    per_day: float
+    # None when nothing was consumed in the window
+    days_until_low_stock: Optional[float] = None
+    low_stock_on: Optional[date] = None
@@ -4,16 +4,23 @@ Run this script from the backend directory: python -m app.seed_data
 """
 
 from sqlalchemy.orm import Session
-from .database import SessionLocal, engine, Base
-from .models import Item, ItemType, ItemStatus
+from .database import SessionLocal, engine
+from .models import Checkout, Item, ItemType, ItemStatus, Location, StockDailyTotal, StockMovement, StockReservation
+from . import crud, migrations, stock, versions
 
 # Create tables if they don't exist
-Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
 
 
 def clear_data(db: Session):
     """Clear all existing data"""
+    # SQLite reuses item ids, so stale stock rows would attach to the new items
+    db.query(StockMovement).delete()
+    db.query(StockReservation).delete()
+    db.query(StockDailyTotal).delete()
+    db.query(Checkout).delete()
     db.query(Item).delete()
+    db.query(Location).delete()
     db.commit()
     print("[OK] Cleared existing data")
 
@@ -303,10 +310,25 @@ def seed_parts(db: Session):
     ]
     
     db.add_all(parts)
+    db.flush()
+    for part in parts:
+        stock.opening_balance(db, part)
     db.commit()
     print(f"[OK] Added {len(parts)} spare parts")
 
 
+def seed_checkouts(db: Session):
+    """Record who has the checked-out devices"""
+    item = db.query(Item).filter(Item.name == "Dell Chromebook 3100").first()
+    checkouts = [
+        Checkout(item_id=item.id, assignee="Teacher Smith", notes="Remote learning"),
+    ]
+    
+    db.add_all(checkouts)
+    db.commit()
+    print(f"[OK] Added {len(checkouts)} checkouts")
+
+
 def seed_all():
     """Main function to seed all data"""
     db = SessionLocal()
@@ -318,6 +340,11 @@ def seed_all():
         clear_data(db)
         seed_devices(db)
         seed_parts(db)
+        seed_checkouts(db)
+        crud.sync_locations(db)
+        # Running servers reload their in-memory item indexes
+        versions.bump_all(db)
+        db.commit()
         
         print("=" * 50)
         print("SUCCESS: Database seeded successfully!")
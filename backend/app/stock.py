@@ -0,0 +1,344 @@
+"""
+Spare-part stock ledger.
+Every change to a part's quantity is a stock_movements row (receive, consume
+or adjust) written in the same transaction as a single conditional UPDATE of
+the item's balance, so concurrent technicians cannot take the same units or
+lose each other's changes. Reservations hold units for pending repairs by
+raising items.reserved; fulfilling one consumes them. Each movement also bumps
+that day's stock_daily_totals row, and consumption rates and low-stock
+forecasts are read from those totals rather than from the ledger.
+"""
+
+import math
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import and_, func, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, contains_eager
+
+from . import item_index, models, suggest, versions
+from .database import DEFAULT_TENANT
+
+# Days of consumption history a forecast averages over by default
+FORECAST_DAYS = int(os.getenv("STOCK_FORECAST_DAYS", "30"))
+
+LIVE_PARTS = and_(models.Item.deleted_at.is_(None), models.Item.type == models.ItemType.part)
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _update_balance(
+    db: Session, item_id: int, quantity: int, reserved: int, *guards, live: bool = True,
+) -> Optional[tuple[int, int]]:
+    """Atomically add to an item's quantity and reserved count if the guards hold; the new (quantity, reserved)"""
+    row = db.execute(
+        update(models.Item)
+        .where(models.Item.id == item_id, LIVE_PARTS if live else true(), *guards)
+        .values(
+            quantity=models.Item.quantity + quantity,
+            reserved=models.Item.reserved + reserved,
+            updated_at=func.now(),
+        )
+        .returning(models.Item.quantity, models.Item.reserved)
+        .execution_options(synchronize_session=False)
+    ).first()
+    return tuple(row) if row else None
+
+
+def _add_daily_total(db: Session, db_item: models.Item, received: int = 0, consumed: int = 0):
+    """Fold a movement into today's pre-aggregated totals for the item"""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    total = models.StockDailyTotal.__table__
+    stmt = dialect.insert(total).values(
+        tenant_id=db_item.tenant_id, item_id=db_item.id, day=_today(), received=received, consumed=consumed,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[total.c.item_id, total.c.day],
+        set_={"received": total.c.received + received, "consumed": total.c.consumed + consumed},
+    ))
+
+
+def _record(
+    db: Session,
+    db_item: models.Item,
+    kind: models.MovementKind,
+    quantity: int,
+    balance: int,
+    notes: Optional[str] = None,
+    reservation_id: Optional[int] = None,
+) -> models.StockMovement:
+    movement = models.StockMovement(
+        tenant_id=db_item.tenant_id,
+        item_id=db_item.id,
+        kind=kind,
+        quantity=quantity,
+        balance=balance,
+        reservation_id=reservation_id,
+        notes=notes,
+    )
+    db.add(movement)
+    if kind == models.MovementKind.receive:
+        _add_daily_total(db, db_item, received=quantity)
+    elif kind == models.MovementKind.consume:
+        _add_daily_total(db, db_item, consumed=-quantity)
+    return movement
+
+
+def _finish(db: Session, db_item: models.Item, *records):
+    before = suggest.snapshot(db_item)
+    version = versions.bump(db, db_item.tenant_id)
+    db.commit()
+    db.refresh(db_item)
+    # A release can land on a deleted part, which neither index holds
+    if db_item.deleted_at is None:
+        item_index.apply(db_item, version)
+        suggest.item_updated(before, db_item, version)
+    for record in records:
+        db.refresh(record)
+
+
+def move(
+    db: Session,
+    db_item: models.Item,
+    kind: models.MovementKind,
+    quantity: int,
+    notes: Optional[str] = None,
+) -> Optional[models.StockMovement]:
+    """Receive, consume or adjust a part's stock; None if it would take reserved or missing units"""
+    if kind == models.MovementKind.receive:
+        delta, guards = quantity, ()
+    elif kind == models.MovementKind.consume:
+        # Only unreserved units can be taken without a reservation
+        delta, guards = -quantity, (models.Item.quantity - models.Item.reserved >= quantity,)
+    else:
+        # A recount can go below the reserved units, never below zero
+        delta, guards = quantity, (models.Item.quantity + quantity >= 0,)
+
+    balance = _update_balance(db, db_item.id, delta, 0, *guards)
+    if balance is None:
+        db.rollback()
+        return None
+    movement = _record(db, db_item, kind, delta, balance[0], notes)
+    _finish(db, db_item, movement)
+    return movement
+
+
+def opening_balance(db: Session, db_item: models.Item):
+    """Record a new part's starting quantity; commits with the caller's transaction"""
+    if db_item.type == models.ItemType.part and db_item.quantity:
+        _record(db, db_item, models.MovementKind.receive, db_item.quantity, db_item.quantity, "Opening balance")
+
+
+def closing_balance(db: Session, db_item: models.Item):
+    """Turn a part into a device, zero its ledger and release its reservations; commits with the caller's transaction"""
+    # Stock can't move once the type changes, so the returned quantity is the final balance
+    quantity = db.scalar(
+        update(models.Item)
+        .where(models.Item.id == db_item.id, models.Item.type == models.ItemType.part)
+        .values(type=models.ItemType.device, reserved=0, updated_at=func.now())
+        .returning(func.coalesce(models.Item.quantity, 0))
+        .execution_options(synchronize_session=False)
+    )
+    # A device holds no stock, so nothing is left for its reservations to use
+    db.execute(
+        update(models.StockReservation)
+        .where(
+            models.StockReservation.item_id == db_item.id,
+            models.StockReservation.status == models.ReservationStatus.open,
+        )
+        .values(status=models.ReservationStatus.released, closed_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    if quantity:
+        _record(db, db_item, models.MovementKind.adjust, -quantity, 0, "Closing balance")
+
+
+def set_quantity(db: Session, db_item: models.Item, quantity: int, notes: Optional[str] = None) -> Optional[models.StockMovement]:
+    """Bring a part's balance to quantity with an adjust movement; commits with the caller's transaction"""
+    while True:
+        balance = func.coalesce(models.Item.quantity, 0)
+        current = db.scalar(select(balance).where(models.Item.id == db_item.id))
+        if current == quantity:
+            return None
+        # Compare-and-set, so a movement landing in between is never overwritten unrecorded
+        changed = db.execute(
+            update(models.Item)
+            .where(models.Item.id == db_item.id, balance == current)
+            .values(quantity=quantity, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if changed:
+            return _record(db, db_item, models.MovementKind.adjust, quantity - current, quantity, notes)
+
+
+def get_movements(db: Session, db_item: models.Item, skip: int = 0, limit: int = 100) -> list[models.StockMovement]:
+    return db.execute(
+        select(models.StockMovement)
+        .where(models.StockMovement.item_id == db_item.id)
+        .order_by(models.StockMovement.created_at.desc(), models.StockMovement.id.desc())
+        .offset(skip)
+        .limit(limit)
+    ).scalars().all()
+
+
+def reserve(
+    db: Session,
+    db_item: models.Item,
+    quantity: int,
+    holder: str,
+    notes: Optional[str] = None,
+) -> Optional[models.StockReservation]:
+    """Hold units for a repair; None if fewer than quantity are unreserved"""
+    held = _update_balance(db, db_item.id, 0, quantity, models.Item.quantity - models.Item.reserved >= quantity)
+    if held is None:
+        db.rollback()
+        return None
+
+    reservation = models.StockReservation(
+        tenant_id=db_item.tenant_id, item_id=db_item.id, quantity=quantity, holder=holder, notes=notes,
+    )
+    db.add(reservation)
+    _finish(db, db_item, reservation)
+    return reservation
+
+
+def get_reservation(db: Session, reservation_id: int, tenant_id: str = DEFAULT_TENANT) -> Optional[models.StockReservation]:
+    reservation = db.get(models.StockReservation, reservation_id)
+    return reservation if reservation and reservation.tenant_id == tenant_id else None
+
+
+def _close(db: Session, reservation: models.StockReservation, status: models.ReservationStatus) -> bool:
+    """Move an open reservation to status; False if it was closed concurrently"""
+    return db.execute(
+        update(models.StockReservation)
+        .where(
+            models.StockReservation.id == reservation.id,
+            models.StockReservation.status == models.ReservationStatus.open,
+        )
+        .values(status=status, closed_at=func.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def fulfill(db: Session, reservation: models.StockReservation) -> Optional[models.StockReservation]:
+    """Consume a reservation's units for its repair; None if it is not open or its part can't supply them"""
+    # The item row is locked before the reservation's, in the same order as a type change takes them
+    q = reservation.quantity
+    # The units were held, so only a deleted part or a recount below them can stop this
+    balance = _update_balance(db, reservation.item_id, -q, -q, models.Item.quantity >= q)
+    if balance is None or not _close(db, reservation, models.ReservationStatus.fulfilled):
+        db.rollback()
+        return None
+    movement = _record(
+        db, reservation.item, models.MovementKind.consume, -q, balance[0],
+        f"Reservation for {reservation.holder}", reservation.id,
+    )
+    _finish(db, reservation.item, reservation, movement)
+    return reservation
+
+
+def release(db: Session, reservation: models.StockReservation) -> Optional[models.StockReservation]:
+    """Give a reservation's units back; None if it is not open"""
+    # Deleted parts too, or a restored part would still hold the units
+    _update_balance(db, reservation.item_id, 0, -reservation.quantity, live=False)
+    if not _close(db, reservation, models.ReservationStatus.released):
+        db.rollback()
+        return None
+    _finish(db, reservation.item, reservation)
+    return reservation
+
+
+def get_reservations(
+    db: Session,
+    item_id: Optional[int] = None,
+    open_only: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+    tenant_id: str = DEFAULT_TENANT,
+) -> list[models.StockReservation]:
+    query = (
+        select(models.StockReservation)
+        .join(models.StockReservation.item)
+        .options(contains_eager(models.StockReservation.item))
+        .where(models.StockReservation.tenant_id == tenant_id, models.Item.deleted_at.is_(None))
+    )
+    if item_id is not None:
+        query = query.where(models.StockReservation.item_id == item_id)
+    if open_only:
+        query = query.where(models.StockReservation.status == models.ReservationStatus.open)
+    query = query.order_by(models.StockReservation.created_at.desc()).offset(skip).limit(limit)
+    return db.execute(query).scalars().all()
+
+
+def get_daily_consumption(db: Session, db_item: models.Item, days: int = FORECAST_DAYS) -> list[dict]:
+    """Units received and consumed per day over the last `days` days, oldest first; quiet days are omitted"""
+    rows = db.execute(
+        select(models.StockDailyTotal.day, models.StockDailyTotal.received, models.StockDailyTotal.consumed)
+        .where(
+            models.StockDailyTotal.item_id == db_item.id,
+            models.StockDailyTotal.day > _today() - timedelta(days=days),
+        )
+        .order_by(models.StockDailyTotal.day)
+    )
+    return [{"day": day, "received": received, "consumed": consumed} for day, received, consumed in rows]
+
+
+def _low_stock_on(today: date, days_left: Optional[float]) -> Optional[date]:
+    # A slow enough rate puts the date past the end of the calendar; leave it undated
+    if days_left is None or days_left >= (date.max - today).days:
+        return None
+    return today + timedelta(days=math.floor(days_left))
+
+
+def forecast(db: Session, days: int = FORECAST_DAYS, tenant_id: str = DEFAULT_TENANT) -> list[dict]:
+    """Each part's average daily consumption and when, at that rate, it reaches its low-stock threshold"""
+    today = _today()
+    consumed = (
+        select(models.StockDailyTotal.item_id, func.sum(models.StockDailyTotal.consumed).label("consumed"))
+        .where(models.StockDailyTotal.tenant_id == tenant_id, models.StockDailyTotal.day > today - timedelta(days=days))
+        .group_by(models.StockDailyTotal.item_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(
+            models.Item.id,
+            models.Item.name,
+            models.Item.quantity,
+            models.Item.reserved,
+            models.Item.low_stock_threshold,
+            func.coalesce(consumed.c.consumed, 0),
+        )
+        .outerjoin(consumed, consumed.c.item_id == models.Item.id)
+        .where(models.Item.tenant_id == tenant_id, LIVE_PARTS)
+    )
+
+    forecasts = []
+    for item_id, name, quantity, reserved, threshold, used in rows:
+        per_day = used / days
+        # Reserved units are as good as gone
+        headroom = (quantity or 0) - reserved - (threshold or 0)
+        if headroom <= 0:
+            days_left = 0.0
+        elif per_day > 0:
+            days_left = headroom / per_day
+        else:
+            days_left = None
+        forecasts.append({
+            "item_id": item_id,
+            "name": name,
+            "quantity": quantity or 0,
+            "reserved": reserved,
+            "low_stock_threshold": threshold or 0,
+            "consumed": used,
+            "per_day": per_day,
+            "days_until_low_stock": days_left,
+            "low_stock_on": _low_stock_on(today, days_left),
+        })
+
+    # Soonest first; parts with no recent consumption last
+    forecasts.sort(key=lambda f: (f["days_until_low_stock"] is None, f["days_until_low_stock"] or 0, f["name"]))
+    return forecasts
@@ -0,0 +1,182 @@
+"""
+Typeahead suggestions for item names and locations, kept per tenant.
+
+Each field keeps a sorted array of (lowercased word-suffix, value) entries so
+a prefix lookup is a bisect plus a short scan; "chrome" finds both
+"Chromebook Chargers" and "Acer Chromebook 315". crud writes update the
+arrays incrementally, and the same change-counter check as the item index
+(see versions) picks up writes from other processes.
+"""
+
+import bisect
+import re
+import threading
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models, versions
+from .database import DEFAULT_TENANT, SessionLocal
+
+CHECK_SECONDS = 5.0
+
+FIELDS = ("name", "location")
+
+# Word boundaries a suggestion can start after
+_WORD_BREAK = re.compile(r"[\s\-/,()]+(?=\S)")
+
+
+def _suffixes(value: str) -> Iterable[str]:
+    lowered = value.lower()
+    yield lowered
+    for match in _WORD_BREAK.finditer(lowered):
+        yield lowered[match.end():]
+
+
+class PrefixIndex:
+    def __init__(self, counts: Optional[Counter] = None):
+        self.counts: Counter = Counter(counts or {})
+        self.entries: list[tuple[str, str]] = sorted(
+            (suffix, value) for value in self.counts for suffix in _suffixes(value)
+        )
+
+    def add(self, value: Optional[str]):
+        if not value:
+            return
+        self.counts[value] += 1
+        if self.counts[value] == 1:
+            for suffix in _suffixes(value):
+                bisect.insort(self.entries, (suffix, value))
+
+    def remove(self, value: Optional[str]):
+        if not value or value not in self.counts:
+            return
+        self.counts[value] -= 1
+        if self.counts[value] > 0:
+            return
+        del self.counts[value]
+        for suffix in _suffixes(value):
+            position = bisect.bisect_left(self.entries, (suffix, value))
+            if position < len(self.entries) and self.entries[position] == (suffix, value):
+                del self.entries[position]
+
+    def search(self, prefix: str, limit: int) -> list[str]:
+        prefix = prefix.lower()
+        results: list[str] = []
+        position = bisect.bisect_left(self.entries, (prefix,))
+        while position < len(self.entries) and len(results) < limit:
+            suffix, value = self.entries[position]
+            if not suffix.startswith(prefix):
+                break
+            if value not in results:
+                results.append(value)
+            position += 1
+        return results
+
+
+class Suggester:
+    def __init__(self, tenant_id: str = DEFAULT_TENANT):
+        self.tenant_id = tenant_id
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.checked_at = 0.0
+        self.fields = {field: PrefixIndex() for field in FIELDS}
+        self.version = 0
+
+    def load(self, db: Session):
+        # Version first, as in item_index, so a write during the load is never missed
+        version = versions.current(db, self.tenant_id)
+        fields = {}
+        for field in self.fields:
+            column = getattr(models.Item, field)
+            rows = db.execute(
+                select(column, func.count())
+                .where(
+                    column.isnot(None),
+                    models.Item.tenant_id == self.tenant_id,
+                    models.Item.deleted_at.is_(None),
+                )
+                .group_by(column)
+            )
+            fields[field] = PrefixIndex(Counter(dict(rows.all())))
+
+        with self.lock:
+            self.fields = fields
+            self.version = version
+            self.loaded = True
+            self.checked_at = time.monotonic()
+
+    def add_item(self, item: models.Item):
+        with self.lock:
+            for field, index in self.fields.items():
+                index.add(getattr(item, field))
+
+    def remove_item(self, values: dict):
+        with self.lock:
+            for field, index in self.fields.items():
+                index.remove(values.get(field))
+
+    def advance(self, version: int):
+        """Catch up to a version written through from this process; a gap means another process wrote"""
+        with self.lock:
+            if version == self.version + 1:
+                self.version = version
+
+
+_suggesters: dict[str, Suggester] = {}
+_suggesters_lock = threading.Lock()
+
+
+def _loaded(tenant_id: str) -> Optional[Suggester]:
+    suggester = _suggesters.get(tenant_id)
+    return suggester if suggester is not None and suggester.loaded else None
+
+
+def suggest(field: str, prefix: str, limit: int = 10, tenant_id: str = DEFAULT_TENANT) -> list[str]:
+    """Up to `limit` distinct values of `field` with a word starting with `prefix`"""
+    with _suggesters_lock:
+        suggester = _suggesters.get(tenant_id)
+        if suggester is None:
+            suggester = _suggesters[tenant_id] = Suggester(tenant_id)
+
+    with suggester.lock:
+        if not suggester.loaded or time.monotonic() - suggester.checked_at >= CHECK_SECONDS:
+            # On the primary, like the item index: a replica could be behind writes already applied here
+            with SessionLocal() as db:
+                if not suggester.loaded or versions.current(db, tenant_id) != suggester.version:
+                    suggester.load(db)
+            suggester.checked_at = time.monotonic()
+        return suggester.fields[field].search(prefix, limit)
+
+
+def snapshot(item: models.Item) -> dict:
+    """Indexed values of an item, taken before crud changes or deletes it"""
+    return {"tenant_id": item.tenant_id, **{field: getattr(item, field) for field in FIELDS}}
+
+
+def item_created(item: models.Item, version: int):
+    suggester = _loaded(item.tenant_id)
+    if suggester:
+        with suggester.lock:
+            suggester.add_item(item)
+            suggester.advance(version)
+
+
+def item_updated(before: dict, item: models.Item, version: int):
+    suggester = _loaded(item.tenant_id)
+    if suggester:
+        with suggester.lock:
+            suggester.remove_item(before)
+            suggester.add_item(item)
+            suggester.advance(version)
+
+
+def item_deleted(before: dict, version: int):
+    suggester = _loaded(before["tenant_id"])
+    if suggester:
+        with suggester.lock:
+            suggester.remove_item(before)
+            suggester.advance(version)
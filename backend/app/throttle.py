@@ -0,0 +1,126 @@
+"""
+Protection for expensive read endpoints during request bursts.
+
+Single-flight coalescing lets concurrent identical reads share one database
+execution, and a per-client token bucket limits how fast any one client can
+call the API at all (off unless RATE_LIMIT_PER_SECOND is set).
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Hashable
+
+# Sustained requests per second per client; 0 disables rate limiting
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+# Requests a client may burst above the sustained rate
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+
+# Forget idle clients once this many buckets are tracked
+_MAX_BUCKETS = 10_000
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn, or wait for and share the result of an identical call in progress"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.buckets: dict[str, tuple[float, float]] = {}  # client -> (tokens, updated)
+        self.allowed = 0
+        self.throttled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, client: str) -> float:
+        """Take a token for client; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                if len(self.buckets) >= _MAX_BUCKETS and client not in self.buckets:
+                    self._forget_idle(now)
+                self.buckets[client] = (tokens - 1, now)
+                self.allowed += 1
+                return 0.0
+            self.buckets[client] = (tokens, now)
+            self.throttled += 1
+            return (1 - tokens) / self.rate
+
+    def _forget_idle(self, now: float):
+        # A bucket that has refilled completely carries no state worth keeping
+        refill = self.burst / self.rate
+        self.buckets = {
+            client: state for client, state in self.buckets.items()
+            if now - state[1] < refill
+        }
+
+
+single_flight = SingleFlight()
+limiter = TokenBucketLimiter(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+
+
+def coalesce(key: Hashable, fn: Callable[[], Any], share: bool = True) -> Any:
+    """Run fn through single-flight; share=False runs it alone, for callers that need a fresh read"""
+    return single_flight.do(key, fn) if share else fn()
+
+
+def stats() -> dict:
+    return {
+        "coalescing": {
+            "executions": single_flight.executions,
+            "coalesced": single_flight.coalesced,
+        },
+        "rate_limit": {
+            "enabled": limiter.enabled,
+            "allowed": limiter.allowed,
+            "throttled": limiter.throttled,
+        },
+    }
@@ -0,0 +1,44 @@
+"""
+Per-tenant change counter for items.
+
+Every transaction that changes a tenant's items bumps the tenant's
+item_versions row just before committing. The in-process read models
+(item_index, suggest) remember the version they loaded and compare it with
+the database to catch writes from other processes. Unlike a count and newest
+updated_at, the counter moves on every write, even two in the same second or
+in one Postgres transaction timestamp, and on writes that leave updated_at
+alone.
+"""
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def bump(db: Session, tenant_id: str) -> int:
+    """Count one more change to the tenant's items; commits with the caller's transaction. The new version"""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    versions = models.ItemVersion.__table__
+    stmt = dialect.insert(versions).values(tenant_id=tenant_id, version=1)
+    # The row lock taken here is held to commit, so versions are handed out in commit order
+    return db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[versions.c.tenant_id],
+            set_={"version": versions.c.version + 1},
+        ).returning(versions.c.version)
+    ).scalar_one()
+
+
+def bump_all(db: Session):
+    """Bump every tenant with items or a version, after bulk changes such as restores and reseeding"""
+    tenants = set(db.scalars(select(models.ItemVersion.tenant_id))) | set(
+        db.scalars(select(models.Item.tenant_id).distinct())
+    )
+    for tenant_id in sorted(tenants):
+        bump(db, tenant_id)
+
+
+def current(db: Session, tenant_id: str) -> int:
+    return db.scalar(select(models.ItemVersion.version).where(models.ItemVersion.tenant_id == tenant_id)) or 0
@@ -1,94 +1,256 @@
 """
 Quick utility to view the current database contents.
-Run from backend directory: python -m app.view_data
+Items are streamed from the database and written as they arrive, and every
+summary number comes from one grouped SQL aggregate, so the report starts at
+once and memory stays flat however large the database is.
+Run from backend directory: python -m app.view_data [--format table|csv|json] [filters]
 """
 
+import argparse
+import csv
+import json
+import sys
+from typing import Iterable, Iterator, Optional, TextIO
+
+from sqlalchemy import and_, case, func, select
 from sqlalchemy.orm import Session
-from .database import SessionLocal
+from .database import DEFAULT_TENANT, SessionLocal
 from .models import Item, ItemType, ItemStatus
 
+COLUMNS = ("id", "name", "type", "location", "status", "quantity", "low_stock_threshold", "notes")
+
+# Rows fetched from the database per round trip while streaming
+FETCH_ROWS = 1000
+
+# Low-stock parts named in the table summary; the count always covers all of them
+LOW_STOCK_LISTED = 20
+
+STATUS_ICONS = {
+    ItemStatus.available: "[AVAIL]",
+    ItemStatus.in_use: "[IN USE]",
+    ItemStatus.broken: "[BROKEN]",
+    ItemStatus.checked_out: "[CHECKOUT]",
+}
+
+IS_LOW_STOCK = and_(Item.type == ItemType.part, Item.quantity <= Item.low_stock_threshold)
+
+
+def item_filters(
+    tenant_id: str = DEFAULT_TENANT,
+    item_type: Optional[str] = None,
+    status: Optional[str] = None,
+    location: Optional[str] = None,
+    search: Optional[str] = None,
+    low_stock: bool = False,
+) -> list:
+    """WHERE conditions shared by the summary and the item stream"""
+    conditions = [Item.tenant_id == tenant_id, Item.deleted_at.is_(None)]
+    if item_type:
+        conditions.append(Item.type == item_type)
+    if status:
+        conditions.append(Item.status == status)
+    if location:
+        conditions.append(Item.location.ilike(f"%{location}%"))
+    if search:
+        conditions.append(Item.name.ilike(f"%{search}%") | Item.notes.ilike(f"%{search}%"))
+    if low_stock:
+        conditions.append(IS_LOW_STOCK)
+    return conditions
+
+
+def summarize(db: Session, conditions: list) -> dict:
+    """Totals by type and status plus the low-stock count, from a single grouped query"""
+    rows = db.execute(
+        select(
+            Item.type,
+            Item.status,
+            func.count(Item.id),
+            func.sum(case((IS_LOW_STOCK, 1), else_=0)),
+        )
+        .where(*conditions)
+        .group_by(Item.type, Item.status)
+    )
+
+    summary = {
+        "total_items": 0,
+        "types": {item_type.value: 0 for item_type in ItemType},
+        "statuses": {status.value: 0 for status in ItemStatus},
+        "low_stock": 0,
+    }
+    for item_type, status, count, low_stock in rows:
+        summary["total_items"] += count
+        summary["types"][item_type.value] += count
+        summary["statuses"][status.value] += count
+        summary["low_stock"] += low_stock or 0
+    return summary
+
+
+def stream_items(db: Session, conditions: list, item_type: ItemType) -> Iterator:
+    """One type's items by name, fetched in batches rather than loaded at once"""
+    # Ordering a single type by name walks the name index instead of sorting every row
+    query = (
+        select(*[getattr(Item, column) for column in COLUMNS])
+        .where(*conditions, Item.type == item_type)
+        .order_by(Item.name)
+        .execution_options(yield_per=FETCH_ROWS)
+    )
+    return iter(db.execute(query))
+
+
+def _value(value):
+    return value.value if isinstance(value, (ItemType, ItemStatus)) else value
+
+
+def write_table(db: Session, conditions: list, summary: dict, out: TextIO):
+    out.write("\n" + "=" * 80 + "\nINVENTORY DATABASE CONTENTS\n" + "=" * 80 + "\n")
+
+    # Display Devices
+    out.write(f"\nDEVICES ({summary['types']['device']}):\n" + "-" * 80 + "\n")
+    for item in stream_items(db, conditions, ItemType.device):
+        lines = [
+            f"{STATUS_ICONS.get(item.status, '[?]')} {item.name}",
+            f"         Location: {item.location or 'No location'}",
+        ]
+        if item.notes:
+            lines.append(f"         Notes: {item.notes}")
+        out.write("\n".join(lines) + "\n\n")
+
+    # Display Parts
+    out.write(f"\nSPARE PARTS ({summary['types']['part']}):\n" + "-" * 80 + "\n")
+    for item in stream_items(db, conditions, ItemType.part):
+        qty_status = " [LOW STOCK!]" if item.quantity <= item.low_stock_threshold else ""
+        lines = [
+            item.name,
+            f"         Quantity: {item.quantity} (threshold: {item.low_stock_threshold}){qty_status}",
+            f"         Location: {item.location}",
+        ]
+        if item.notes:
+            lines.append(f"         Notes: {item.notes}")
+        out.write("\n".join(lines) + "\n\n")
+
+    write_summary(db, conditions, summary, out)
+
 
-def view_all_data():
-    """Display all items in the database"""
+def write_summary(db: Session, conditions: list, summary: dict, out: TextIO):
+    statuses = summary["statuses"]
+    out.write(
+        "=" * 80 + "\n"
+        "SUMMARY:\n"
+        f"  Total Items: {summary['total_items']}\n"
+        f"  Devices: {summary['types']['device']}\n"
+        f"  Spare Parts: {summary['types']['part']}\n"
+        "\n  Status Breakdown:\n"
+        f"    Available: {statuses['available']}\n"
+        f"    In Use: {statuses['in_use']}\n"
+        f"    Broken: {statuses['broken']}\n"
+        f"    Checked Out: {statuses['checked_out']}\n"
+        f"\n  Low Stock Items: {summary['low_stock']}\n"
+    )
+    if summary["low_stock"]:
+        low_stock = db.execute(
+            select(Item.name, Item.quantity)
+            .where(*conditions, IS_LOW_STOCK)
+            .order_by(Item.name)
+            .limit(LOW_STOCK_LISTED)
+        )
+        for name, quantity in low_stock:
+            out.write(f"    - {name} (only {quantity} left)\n")
+        if summary["low_stock"] > LOW_STOCK_LISTED:
+            out.write(f"    ... and {summary['low_stock'] - LOW_STOCK_LISTED} more\n")
+    out.write("=" * 80 + "\n\n")
+
+
+def _all_rows(db: Session, conditions: list) -> Iterable:
+    for item_type in ItemType:
+        yield from stream_items(db, conditions, item_type)
+
+
+def write_csv(db: Session, conditions: list, summary: dict, out: TextIO):
+    writer = csv.writer(out)
+    writer.writerow(COLUMNS)
+    for row in _all_rows(db, conditions):
+        writer.writerow([_value(value) for value in row])
+
+
+def write_json(db: Session, conditions: list, summary: dict, out: TextIO):
+    # Written piece by piece so the array never has to exist in memory
+    out.write('{"summary": ' + json.dumps(summary) + ', "items": [')
+    for n, row in enumerate(_all_rows(db, conditions)):
+        if n:
+            out.write(", ")
+        out.write(json.dumps(dict(zip(COLUMNS, (_value(value) for value in row)))))
+    out.write("]}\n")
+
+
+FORMATS = {
+    "table": write_table,
+    "csv": write_csv,
+    "json": write_json,
+}
+
+
+def view_all_data(fmt: str = "table", summary_only: bool = False, out: TextIO = sys.stdout, **filters):
+    """Display the items in the database, filtered, in the given format"""
     db = SessionLocal()
-    
+
     try:
-        items = db.query(Item).order_by(Item.type, Item.name).all()
-        
-        if not items:
-            print("\nNo items in database. Run 'python -m app.seed_data' to add sample data.\n")
+        conditions = item_filters(**filters)
+        summary = summarize(db, conditions)
+
+        if fmt == "table" and not summary["total_items"]:
+            if any(filters.get(name) for name in ("item_type", "status", "location", "search", "low_stock")):
+                out.write("\nNo items match those filters.\n\n")
+            else:
+                out.write("\nNo items in database. Run 'python -m app.seed_data' to add sample data.\n\n")
             return
-        
-        print("\n" + "=" * 80)
-        print("INVENTORY DATABASE CONTENTS")
-        print("=" * 80)
-        
-        # Group by type
-        devices = [i for i in items if i.type == ItemType.device]
-        parts = [i for i in items if i.type == ItemType.part]
-        
-        # Display Devices
-        print(f"\nDEVICES ({len(devices)}):")
-        print("-" * 80)
-        for item in devices:
-            status_icon = {
-                ItemStatus.available: "[AVAIL]",
-                ItemStatus.in_use: "[IN USE]",
-                ItemStatus.broken: "[BROKEN]",
-                ItemStatus.checked_out: "[CHECKOUT]"
-            }.get(item.status, "[?]")
-            
-            location = item.location or "No location"
-            print(f"{status_icon} {item.name}")
-            print(f"         Location: {location}")
-            if item.notes:
-                print(f"         Notes: {item.notes}")
-            print()
-        
-        # Display Parts
-        print(f"\nSPARE PARTS ({len(parts)}):")
-        print("-" * 80)
-        for item in parts:
-            qty_status = ""
-            if item.quantity <= item.low_stock_threshold:
-                qty_status = " [LOW STOCK!]"
-            
-            print(f"{item.name}")
-            print(f"         Quantity: {item.quantity} (threshold: {item.low_stock_threshold}){qty_status}")
-            print(f"         Location: {item.location}")
-            if item.notes:
-                print(f"         Notes: {item.notes}")
-            print()
-        
-        # Summary
-        print("=" * 80)
-        print("SUMMARY:")
-        print(f"  Total Items: {len(items)}")
-        print(f"  Devices: {len(devices)}")
-        print(f"  Spare Parts: {len(parts)}")
-        
-        available = len([i for i in items if i.status == ItemStatus.available])
-        in_use = len([i for i in items if i.status == ItemStatus.in_use])
-        broken = len([i for i in items if i.status == ItemStatus.broken])
-        checked_out = len([i for i in items if i.status == ItemStatus.checked_out])
-        
-        print(f"\n  Status Breakdown:")
-        print(f"    Available: {available}")
-        print(f"    In Use: {in_use}")
-        print(f"    Broken: {broken}")
-        print(f"    Checked Out: {checked_out}")
-        
-        low_stock = [i for i in parts if i.quantity <= i.low_stock_threshold]
-        print(f"\n  Low Stock Items: {len(low_stock)}")
-        if low_stock:
-            for item in low_stock:
-                print(f"    - {item.name} (only {item.quantity} left)")
-        
-        print("=" * 80 + "\n")
-        
+
+        if summary_only:
+            if fmt == "table":
+                write_summary(db, conditions, summary, out)
+            elif fmt == "csv":
+                writer = csv.writer(out)
+                writer.writerow(("metric", "count"))
+                writer.writerow(("total_items", summary["total_items"]))
+                for group in ("types", "statuses"):
+                    writer.writerows(summary[group].items())
+                writer.writerow(("low_stock", summary["low_stock"]))
+            else:
+                out.write(json.dumps(summary, indent=2) + "\n")
+            return
+
+        FORMATS[fmt](db, conditions, summary, out)
+
     finally:
         db.close()
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Print the inventory as a table, CSV or JSON")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="table")
+    parser.add_argument("--summary", action="store_true", help="only print the summary numbers")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="school to report on")
+    parser.add_argument("--type", choices=[item_type.value for item_type in ItemType])
+    parser.add_argument("--status", choices=[status.value for status in ItemStatus])
+    parser.add_argument("--location", help="location name contains")
+    parser.add_argument("--search", help="name or notes contain")
+    parser.add_argument("--low-stock", action="store_true", help="only parts at or below their threshold")
+    args = parser.parse_args()
+
+    try:
+        view_all_data(
+            fmt=args.format,
+            summary_only=args.summary,
+            tenant_id=args.tenant,
+            item_type=args.type,
+            status=args.status,
+            location=args.location,
+            search=args.search,
+            low_stock=args.low_stock,
+        )
+    except BrokenPipeError:
+        # Output piped into head/less that exited early
+        sys.stderr.close()
+
+
 if __name__ == "__main__":
-    view_all_data()
+    main()
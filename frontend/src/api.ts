@@ -73,3 +73,9 @@ export async function fetchLocations(): Promise<string[]> {
   const response = await fetch(`${API_BASE}/locations`);
   return handleResponse(response);
 }
+
+export async function fetchSuggestions(q: string, field: 'name' | 'location' = 'name'): Promise<string[]> {
+  const searchParams = new URLSearchParams({ q, field });
+  const response = await fetch(`${API_BASE}/suggest?${searchParams}`);
+  return handleResponse(response);
+}
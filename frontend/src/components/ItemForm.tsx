@@ -96,14 +96,16 @@ export default function ItemForm({ item, onSubmit, onCancel }: ItemFormProps) {
             <label className="block text-sm font-medium text-gray-700 mb-1">
               Status *
             </label>
+            {/* Checked out is set and cleared by checkout and checkin, not by editing */}
             <select
               value={formData.status}
               onChange={(e) => setFormData({ ...formData, status: e.target.value as ItemStatus })}
-              className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500"
+              disabled={item?.status === 'checked_out'}
+              className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500 disabled:bg-gray-100"
             >
               <option value="available">Available</option>
               <option value="in_use">In Use</option>
-              <option value="checked_out">Checked Out</option>
+              {item?.status === 'checked_out' && <option value="checked_out">Checked Out</option>}
               <option value="broken">Broken</option>
             </select>
           </div>
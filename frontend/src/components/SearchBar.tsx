@@ -1,10 +1,38 @@
+import { useEffect, useId, useState } from 'react';
+import { fetchSuggestions } from '../api';
+
 interface SearchBarProps {
   value: string;
   onChange: (value: string) => void;
   placeholder?: string;
+  suggestField?: 'name' | 'location';
 }
 
-export default function SearchBar({ value, onChange, placeholder = 'Search...' }: SearchBarProps) {
+// Wait for a pause in typing before asking for suggestions
+const SUGGEST_DEBOUNCE_MS = 150;
+
+export default function SearchBar({ value, onChange, placeholder = 'Search...', suggestField }: SearchBarProps) {
+  const listId = useId();
+  const [suggestions, setSuggestions] = useState<string[]>([]);
+
+  useEffect(() => {
+    const q = value.trim();
+    if (!suggestField || !q) {
+      setSuggestions([]);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(() => {
+      fetchSuggestions(q, suggestField)
+        .then((results) => { if (!cancelled) setSuggestions(results); })
+        .catch(() => { if (!cancelled) setSuggestions([]); });
+    }, SUGGEST_DEBOUNCE_MS);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [value, suggestField]);
+
   return (
     <div className="relative">
       <div className="absolute inset-y-0 left-0 pl-3 flex items-center pointer-events-none">
@@ -17,8 +45,16 @@ export default function SearchBar({ value, onChange, placeholder = 'Search...' }
         value={value}
         onChange={(e) => onChange(e.target.value)}
         placeholder={placeholder}
+        list={suggestField ? listId : undefined}
         className="block w-full pl-10 pr-3 py-2 border border-gray-300 rounded-lg text-sm placeholder-gray-400 focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-transparent"
       />
+      {suggestField && (
+        <datalist id={listId}>
+          {suggestions.map((suggestion) => (
+            <option key={suggestion} value={suggestion} />
+          ))}
+        </datalist>
+      )}
     </div>
   );
 }
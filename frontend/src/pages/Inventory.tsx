@@ -6,6 +6,9 @@ import ItemCard from '../components/ItemCard';
 import ItemForm from '../components/ItemForm';
 import SearchBar from '../components/SearchBar';
 
+// Wait for a pause in typing before fetching the list, instead of on every keystroke
+const SEARCH_DEBOUNCE_MS = 300;
+
 export default function Inventory() {
   const [searchParams, setSearchParams] = useSearchParams();
   const [items, setItems] = useState<Item[]>([]);
@@ -20,10 +23,16 @@ export default function Inventory() {
   const [search, setSearch] = useState(searchParams.get('search') || '');
   const [typeFilter, setTypeFilter] = useState(searchParams.get('type') || '');
   const [statusFilter, setStatusFilter] = useState(searchParams.get('status') || '');
+  const [debouncedSearch, setDebouncedSearch] = useState(search);
+
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(search), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [search]);
 
   useEffect(() => {
     loadItems();
-  }, [search, typeFilter, statusFilter]);
+  }, [debouncedSearch, typeFilter, statusFilter]);
 
   useEffect(() => {
     // Update URL params when filters change
@@ -38,7 +47,7 @@ export default function Inventory() {
     try {
       setLoading(true);
       const data = await fetchItems({
-        search: search || undefined,
+        search: debouncedSearch || undefined,
         type: typeFilter || undefined,
         status: statusFilter || undefined,
       });
@@ -114,6 +123,7 @@ export default function Inventory() {
               value={search}
               onChange={setSearch}
               placeholder="Search by name, location, or notes..."
+              suggestField="name"
             />
           </div>
           <div className="flex gap-3">